@@ -15,7 +15,17 @@ import json
 import re
 import sys
 import base64
-from datetime import datetime
+import hashlib
+import sqlite3
+import shutil
+import tempfile
+import textwrap
+import mimetypes
+import heapq
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from collections import defaultdict
 
@@ -30,6 +40,23 @@ else:
     OUTPUT_DIR = os.path.expanduser("~/Downloads/Android_SMS_Export")
 
 STATE_FILE = os.path.join(OUTPUT_DIR, ".export_state.json")
+# Fingerprints of every exported message (see FingerprintIndex)
+FINGERPRINT_FILE = os.path.join(OUTPUT_DIR, ".fingerprints")
+# Whether each .xml file seen while searching is a backup, by path, size and mtime
+SCAN_CACHE_FILE = os.path.join(OUTPUT_DIR, ".backup_scan.json")
+# Size and SHA-256 of every markdown day file as last written
+MARKDOWN_MANIFEST_FILE = os.path.join(OUTPUT_DIR, ".markdown_manifest.jsonl")
+# Manifest entries and fingerprints of an export being saved (see commit_export())
+EXPORT_JOURNAL_FILE = os.path.join(OUTPUT_DIR, ".export_journal.json")
+
+# Distinct phone numbers whose display format is remembered by format_phone
+PHONE_FORMAT_CACHE_SIZE = 4096
+
+# Strips everything but digits from a phone number
+NON_DIGITS = re.compile(r'\D')
+
+# File extensions kept from an attachment's name; anything else uses its MIME type
+SAFE_EXTENSION = re.compile(r'\.[a-z0-9]{1,10}')
 
 # Message type mapping (from Android SMS database)
 MESSAGE_TYPES = {
@@ -49,6 +76,33 @@ MMS_BOX_TYPES = {
     4: "outbox"
 }
 
+# Elements that hold one record each in an SMS Backup & Restore file
+BACKUP_RECORD_TAGS = ("sms", "mms", "call")
+
+# How deep below each search folder to look for backups
+SEARCH_DEPTH = 2
+
+# Bytes read from the start of an .xml file to tell whether it's a backup
+SNIFF_SIZE = 1000
+
+# Where a record starts; '<' is always escaped inside attribute values
+RECORD_START = re.compile(rb'<(?:sms|mms|call)[\s/>]')
+
+# How the backup's root element closes
+ROOT_END = re.compile(rb'</(?:smses|calls)\s*>')
+
+# Bytes read at a time when scanning or parsing part of a backup
+READ_CHUNK_SIZE = 1 << 20
+
+# Backups smaller than this are parsed in one process even with --workers
+PARALLEL_MIN_BYTES = 32 << 20
+
+# Bytes hashed at each end of a backup's records to recognise a later, longer copy of it
+RESUME_WINDOW = 64 << 10
+
+# Base64 characters decoded at a time when saving an MMS attachment (a multiple of 4)
+BASE64_CHUNK_SIZE = 1 << 16
+
 # Call log types
 CALL_TYPES = {
     1: "incoming",
@@ -59,6 +113,74 @@ CALL_TYPES = {
     6: "refused"
 }
 
+# Local search database (desmond.db)
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT,
+    UNIQUE (source, name)
+);
+CREATE TABLE IF NOT EXISTS senders (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id),
+    sender_id INTEGER NOT NULL REFERENCES senders (id),
+    timestamp TEXT NOT NULL,
+    is_from_me INTEGER NOT NULL,
+    message_type TEXT,
+    text TEXT,
+    attachment_types TEXT,
+    reaction TEXT,
+    special_content TEXT,
+    effect TEXT,
+    service TEXT,
+    UNIQUE (source, source_id)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender_id, timestamp);
+"""
+
+# Full-text index over messages.text, kept in sync by triggers
+DB_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (text, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+DB_UPSERT_MESSAGE = """
+INSERT INTO messages (source, source_id, conversation_id, sender_id, timestamp, is_from_me,
+                      message_type, text, attachment_types, reaction, special_content, effect, service)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, source_id) DO UPDATE SET
+    conversation_id = excluded.conversation_id,
+    sender_id = excluded.sender_id,
+    timestamp = excluded.timestamp,
+    is_from_me = excluded.is_from_me,
+    message_type = excluded.message_type,
+    text = excluded.text,
+    attachment_types = excluded.attachment_types,
+    reaction = excluded.reaction,
+    special_content = excluded.special_content,
+    effect = excluded.effect,
+    service = excluded.service
+"""
+
 
 def find_backup_files(search_paths=None):
     """Find SMS Backup & Restore XML files."""
@@ -80,28 +202,48 @@ def find_backup_files(search_paths=None):
                 os.path.expandvars(r"%USERPROFILE%\Documents"),
             ])
 
-    backup_files = []
-
+    # The same folder can be listed twice (e.g. ~/Downloads and %USERPROFILE%\Downloads)
+    roots = []
     for search_path in search_paths:
-        if not os.path.exists(search_path):
-            continue
+        root = os.path.realpath(search_path)
+        if root not in roots and os.path.isdir(root):
+            roots.append(root)
+
+    cache = load_scan_cache()
+    verdicts = {}
+    backup_files = []
 
+    for search_path in roots:
         print(f"  Checking: {search_path}")
 
         # Look for XML files that match SMS Backup & Restore naming patterns
         for root, dirs, files in os.walk(search_path):
-            # Don't recurse too deep
-            depth = root.replace(search_path, '').count(os.sep)
-            if depth > 2:
-                continue
+            # Don't recurse too deep, and leave the other search folders to their own walk
+            depth = 0 if root == search_path else os.path.relpath(root, search_path).count(os.sep) + 1
+            if depth >= SEARCH_DEPTH:
+                dirs[:] = []
+            else:
+                dirs[:] = [d for d in dirs if os.path.join(root, d) not in roots]
 
             for filename in files:
                 if filename.endswith('.xml'):
                     filepath = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(filepath)
+                    except OSError:
+                        continue
+
+                    # Only read files that are new or changed since the last search
+                    key = [stat.st_size, stat.st_mtime]
+                    cached = cache.get(filepath)
+                    if cached and cached[:2] == key:
+                        verdict = cached[2]
+                    else:
+                        verdict = is_sms_backup(filepath)
+                    verdicts[filepath] = key + [verdict]
 
                     # Check if it looks like an SMS backup
-                    if is_sms_backup(filepath):
-                        stat = os.stat(filepath)
+                    if verdict:
                         backup_files.append({
                             "path": filepath,
                             "filename": filename,
@@ -110,62 +252,314 @@ def find_backup_files(search_paths=None):
                         })
                         print(f"    Found: {filename}")
 
+    if verdicts or cache:
+        save_scan_cache(verdicts)
+
     # Sort by modification time, most recent first
     backup_files.sort(key=lambda x: x["modified"], reverse=True)
 
     return backup_files
 
 
+def load_scan_cache():
+    """Load the verdicts of the last search, {path: [size, mtime, is_backup]}."""
+    if os.path.exists(SCAN_CACHE_FILE):
+        try:
+            with open(SCAN_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            pass
+    return {}
+
+
+def save_scan_cache(verdicts):
+    """Save this search's verdicts, dropping files that are gone."""
+    os.makedirs(os.path.dirname(SCAN_CACHE_FILE), exist_ok=True)
+    temp_path = SCAN_CACHE_FILE + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(verdicts, f)
+    os.replace(temp_path, SCAN_CACHE_FILE)
+
+
 def is_sms_backup(filepath):
     """Check if a file is an SMS Backup & Restore XML file."""
     try:
         # Read just the beginning of the file to check
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            header = f.read(1000)
+        with open(filepath, 'rb') as f:
+            header = f.read(SNIFF_SIZE)
 
         # Look for SMS Backup & Restore signatures
-        if '<smses' in header or '<sms protocol=' in header:
+        if b'<smses' in header or b'<sms protocol=' in header:
             return True
-        if '<mms ' in header and 'msg_box=' in header:
+        if b'<mms ' in header and b'msg_box=' in header:
             return True
-        if '<calls' in header and '<call number=' in header:
+        if b'<calls' in header and b'<call number=' in header:
             return True
 
-    except Exception:
+    except OSError:
         pass
 
     return False
 
 
-def parse_sms_backup(filepath):
-    """Parse an SMS Backup & Restore XML file."""
-    print(f"\nParsing: {filepath}")
+def matches_filters(item, filters):
+    """Check a parsed message or call log against the --since/--until/--conversation/--sender filters."""
+    timestamp = item["timestamp"]
+    if "since" in filters and (timestamp is None or timestamp < filters["since"]):
+        return False
+    # The --until day is included
+    if "until" in filters and (timestamp is None or timestamp >= filters["until"] + timedelta(days=1)):
+        return False
+    if "conversation" in filters:
+        name = filters["conversation"].lower()
+        conversation = item["conversation"] if "conversation" in item else item["contact"]
+        address = item["address"] if "address" in item else item["number"]
+        if name != conversation.lower() and name != (address or "").lower():
+            return False
+    if "sender" in filters and "sender" in item and filters["sender"].lower() != item["sender"].lower():
+        return False
+    return True
+
+
+def iter_backup_records(filepath, byte_range=None):
+    """Stream the <sms>, <mms> and <call> elements of a backup file, one at a time.
+
+    Each element is yielded once it's complete (an MMS with its parts and
+    addresses) and dropped as soon as the caller moves on, so memory use stays
+    flat no matter how big the backup and its base64 MMS attachments are.
+    Pass byte_range=(start, end) from split_backup() to read only those records.
+    """
+    if byte_range is None:
+        context = ET.iterparse(filepath, events=("start", "end"))
+        # The first start event is the root (<smses> or <calls>)
+        _, root = next(context)
+        for event, elem in context:
+            if event == "end" and elem.tag in BACKUP_RECORD_TAGS:
+                yield elem
+                # Records sit directly under the root; clearing it frees everything parsed so far
+                root.clear()
+        return
+
+    # A run of records isn't a document on its own, so give it a root of its own
+    start, end = byte_range
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parser.feed(b"<records>")
+    root = None
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while True:
+            chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+            remaining -= len(chunk)
+            if not chunk:
+                parser.feed(b"</records>")
+                parser.close()
+            else:
+                parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if root is None:
+                    root = elem
+                elif event == "end" and elem.tag in BACKUP_RECORD_TAGS:
+                    yield elem
+                    root.clear()
+            if not chunk:
+                return
+
+
+def find_record_start(f, offset):
+    """Offset of the first record that starts at or after offset, or None."""
+    f.seek(offset)
+    # Keep a few bytes from the last read so a tag split across two reads is still found
+    carry = b""
+    while True:
+        chunk = f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return None
+        data = carry + chunk
+        match = RECORD_START.search(data)
+        if match:
+            return offset - len(carry) + match.start()
+        carry = data[-8:]
+        offset += len(chunk)
+
+
+def backup_layout(filepath):
+    """Return (first, end, complete) for the span of a backup that holds its records.
+
+    first is the offset of the first record and end that of the root's closing
+    tag, or the end of the file when it has none (complete is then False, as
+    the backup was cut short). Returns None when the backup has no records.
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, 'rb') as f:
+        f.seek(max(0, size - 4096))
+        tail = f.read()
+        closing = list(ROOT_END.finditer(tail))
+        end = size - len(tail) + closing[-1].start() if closing else size
+
+        first = find_record_start(f, 0)
+    if first is None or first >= end:
+        return None
+    return first, end, bool(closing)
+
+
+def split_backup(filepath, parts, byte_range=None):
+    """Split a backup, or the records in byte_range, into up to `parts` ranges of whole records."""
+    if byte_range is None:
+        layout = backup_layout(filepath)
+        if layout is None:
+            return []
+        byte_range = layout[:2]
+    first, end = byte_range
 
+    with open(filepath, 'rb') as f:
+        # The root's closing tag belongs to no range
+        starts = [first]
+        for k in range(1, parts):
+            start = find_record_start(f, max(first + (end - first) * k // parts, starts[-1] + 1))
+            if start is None or start >= end:
+                break
+            starts.append(start)
+
+    return list(zip(starts, starts[1:] + [end]))
+
+
+def window_hash(mm, start, end):
+    return hashlib.sha1(mm[start:end]).hexdigest()
+
+
+def resume_point(filepath):
+    """Describe the records of a fully read backup, so a later copy that extends it can skip them.
+
+    A point holds hashes of the first and last RESUME_WINDOW bytes of the
+    records, and their length; offsets count from the first record, as the
+    root's attributes (e.g. count) change from one backup to the next.
+    Returns None for a backup that was cut short.
+    """
+    layout = backup_layout(filepath)
+    if layout is None or not layout[2]:
+        return None
+    first, end, _ = layout
+    length = end - first
+    window = min(RESUME_WINDOW, length)
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return {
+            "head": window_hash(mm, first, first + window),
+            "length": length,
+            "tail": window_hash(mm, end - window, end)
+        }
+
+
+def find_resume_range(filepath, points):
+    """Byte range of the records a backup adds to one already read, or None.
+
+    A backup extends an earlier one (its lineage) when it starts with the same
+    records and has the earlier one's last records at the same offset; only the
+    records after those need parsing.
+    """
+    layout = backup_layout(filepath)
+    if layout is None:
+        return None
+    first, end, _ = layout
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # Skip as much as possible when several earlier copies match
+        for point in sorted(points, key=lambda p: p["length"], reverse=True):
+            length = point["length"]
+            window = min(RESUME_WINDOW, length)
+            if end - first < length:
+                continue
+            if (window_hash(mm, first, first + window) == point["head"]
+                    and window_hash(mm, first + length - window, first + length) == point["tail"]):
+                return first + length, end
+    return None
+
+
+def parse_records(records, filters=None, attachments_dir=None, exported=None):
+    """Turn backup elements into message and call log dicts, keeping those that match filters.
+
+    With attachments_dir, the payloads of the kept MMS messages are saved there
+    (see save_mms_parts()), except for messages whose fingerprint digest is in
+    exported (see FingerprintIndex), which were saved by an earlier export.
+    """
     messages = []
     call_logs = []
 
-    try:
-        # Parse the XML file
-        tree = ET.parse(filepath)
-        root = tree.getroot()
-
-        # Process SMS messages
-        for sms in root.findall('.//sms'):
-            msg = parse_sms_element(sms)
-            if msg:
-                messages.append(msg)
-
-        # Process MMS messages
-        for mms in root.findall('.//mms'):
-            msg = parse_mms_element(mms)
-            if msg:
-                messages.append(msg)
-
-        # Process call logs (optional)
-        for call in root.findall('.//call'):
-            log = parse_call_element(call)
-            if log:
+    for elem in records:
+        if elem.tag == "call":
+            log = parse_call_element(elem)
+            if log and (not filters or matches_filters(log, filters)):
                 call_logs.append(log)
+            continue
+
+        if elem.tag == "sms":
+            msg = parse_sms_element(elem)
+        else:
+            msg = parse_mms_element(elem)
+        if msg and (not filters or matches_filters(msg, filters)):
+            if attachments_dir and elem.tag == "mms" and msg.get('timestamp'):
+                if not exported or bytes.fromhex(message_fingerprint(msg)) not in exported:
+                    msg["attachment_files"] = save_mms_parts(elem, attachments_dir)
+            messages.append(msg)
+
+    return messages, call_logs
+
+
+def by_timestamp(item):
+    """Sort key for messages and call logs; ones without a timestamp go first."""
+    return item["timestamp"] or datetime.min
+
+
+def parse_backup_range(filepath, byte_range, filters=None, attachments_dir=None, exported=None):
+    """Parse one byte range of a backup in a worker process, sorted by timestamp for merging."""
+    messages, call_logs = parse_records(iter_backup_records(filepath, byte_range), filters, attachments_dir, exported)
+    messages.sort(key=by_timestamp)
+    call_logs.sort(key=by_timestamp)
+    return messages, call_logs
+
+
+def parse_backup_parallel(filepath, workers, filters=None, attachments_dir=None, byte_range=None, exported=None):
+    """Parse a backup, or the records in byte_range, with a pool of worker processes.
+
+    The ranges split the file at record boundaries, so each worker parses whole
+    records on its own core. Each returns its records sorted by timestamp, and
+    they're merged back into one timeline.
+    """
+    ranges = split_backup(filepath, workers, byte_range)
+    print(f"  Parsing {len(ranges)} parts in parallel")
+
+    with ProcessPoolExecutor(max_workers=len(ranges) or 1) as pool:
+        results = list(pool.map(parse_backup_range, [filepath] * len(ranges), ranges,
+                                [filters] * len(ranges), [attachments_dir] * len(ranges),
+                                [exported] * len(ranges)))
+
+    messages = list(heapq.merge(*(result[0] for result in results), key=by_timestamp))
+    call_logs = list(heapq.merge(*(result[1] for result in results), key=by_timestamp))
+    return messages, call_logs
+
+
+def parse_sms_backup(filepath, filters=None, workers=1, attachments_dir=None, byte_range=None, exported=None):
+    """Parse an SMS Backup & Restore XML file.
+
+    Pass filters (see matches_filters()) to keep only the matching messages and
+    call logs as they're parsed. With workers > 1, large backups are parsed in
+    that many processes at once. With attachments_dir, MMS attachments are saved,
+    skipping messages in exported (see parse_records()).
+    Pass byte_range from find_resume_range() to parse only the records in it.
+    """
+    if byte_range is None:
+        print(f"\nParsing: {filepath}")
+        size = os.path.getsize(filepath)
+    else:
+        print(f"\nParsing: {filepath} (new records only, from byte {byte_range[0]:,})")
+        size = byte_range[1] - byte_range[0]
+
+    try:
+        if workers > 1 and size >= PARALLEL_MIN_BYTES:
+            messages, call_logs = parse_backup_parallel(filepath, workers, filters, attachments_dir, byte_range, exported)
+        else:
+            # Handle each record as it's read, in one pass over the file
+            messages, call_logs = parse_records(iter_backup_records(filepath, byte_range), filters, attachments_dir,
+                                                exported)
 
         print(f"  Parsed {len(messages)} messages and {len(call_logs)} call logs")
 
@@ -211,6 +605,8 @@ def parse_sms_element(sms):
         return {
             "source": "sms",
             "timestamp": timestamp,
+            "raw_date": int(date_ms) if date_ms else None,
+            "raw_type": msg_type,
             "conversation": conversation,
             "address": address,
             "sender": sender,
@@ -299,6 +695,8 @@ def parse_mms_element(mms):
         return {
             "source": "mms",
             "timestamp": timestamp,
+            "raw_date": int(date_ms) if date_ms else None,
+            "raw_type": msg_box,
             "conversation": conversation,
             "address": address,
             "sender": sender,
@@ -315,6 +713,73 @@ def parse_mms_element(mms):
         return None
 
 
+def store_attachment(data, content_type, name, attachments_dir):
+    """Decode a base64 payload to disk in chunks and file it under its SHA-256 hash.
+
+    The decoded file is written and hashed a chunk at a time, never held whole, and
+    identical media (like a photo forwarded to several threads) is stored once.
+    Returns the file's path relative to the output folder.
+    """
+    os.makedirs(attachments_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=attachments_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            carry = ""
+            for start in range(0, len(data), BASE64_CHUNK_SIZE):
+                # Skip line breaks and keep whole 4-character groups for the next chunk
+                piece = carry + "".join(data[start:start + BASE64_CHUNK_SIZE].split())
+                usable = len(piece) - len(piece) % 4
+                chunk = base64.b64decode(piece[:usable])
+                carry = piece[usable:]
+                digest.update(chunk)
+                f.write(chunk)
+            if carry:
+                # The payload's last group, short its '=' padding; b64decode raises
+                # binascii.Error if it still isn't valid
+                chunk = base64.b64decode(carry + "=" * (-len(carry) % 4))
+                digest.update(chunk)
+                f.write(chunk)
+
+        # The name comes from the backup, so only keep an extension every filesystem accepts
+        extension = os.path.splitext(name)[1].lower() if name and name != "null" else ""
+        if not SAFE_EXTENSION.fullmatch(extension):
+            extension = mimetypes.guess_extension(content_type.split(';')[0].strip()) or ""
+        file_hash = digest.hexdigest()
+        relative_path = f"{os.path.basename(attachments_dir)}/{file_hash[:2]}/{file_hash}{extension}"
+        final_path = os.path.join(os.path.dirname(attachments_dir), *relative_path.split("/"))
+
+        if os.path.exists(final_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+    except BaseException:
+        # Don't leave a half-written payload behind
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return relative_path
+
+
+def save_mms_parts(mms, attachments_dir):
+    """Save the payload of each of an MMS message's parts and return the stored files' paths."""
+    files = []
+    for part in mms.iter('part'):
+        data = part.get('data')
+        ct = part.get('ct', '')
+        if not data or 'application/smil' in ct:
+            continue
+        name = part.get('cl') or part.get('name')
+        try:
+            files.append(store_attachment(data, ct, name, attachments_dir))
+        except (ValueError, OSError) as e:
+            print(f"    Warning: Could not save MMS attachment {name or ct}: {e}")
+        # The payload is on disk now (or unusable), so let it go
+        del part.attrib['data']
+    return files
+
+
 def parse_call_element(call):
     """Parse a single call log element."""
     try:
@@ -341,13 +806,14 @@ def parse_call_element(call):
         return None
 
 
+@lru_cache(maxsize=PHONE_FORMAT_CACHE_SIZE)
 def format_phone(number):
-    """Format a phone number for display."""
+    """Format a phone number for display, once per distinct number."""
     if not number:
         return "Unknown"
 
     # Remove non-digit characters for normalization
-    digits = re.sub(r'\D', '', number)
+    digits = NON_DIGITS.sub('', number)
 
     # Format US numbers nicely
     if len(digits) == 10:
@@ -373,8 +839,76 @@ def save_state(state):
         json.dump(state, f)
 
 
+def load_markdown_manifest():
+    """Load the size and SHA-256 of each day file, keyed by "conversation/date"."""
+    manifest = {}
+    if os.path.exists(MARKDOWN_MANIFEST_FILE):
+        with open(MARKDOWN_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                manifest[entry["day"]] = entry
+    return manifest
+
+
+def save_markdown_manifest(manifest):
+    """Save the manifest atomically, one JSON line per day file."""
+    temp_path = MARKDOWN_MANIFEST_FILE + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for key in sorted(manifest):
+            f.write(json.dumps(manifest[key]) + "\n")
+    os.replace(temp_path, MARKDOWN_MANIFEST_FILE)
+
+
+def existing_day_content(filename, entry):
+    """The content new messages for a day go after: what the manifest recorded, if it's intact."""
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if entry and len(data) >= entry["size"] and hashlib.sha256(data[:entry["size"]]).hexdigest() == entry["sha256"]:
+        return data[:entry["size"]]
+    # Written before the manifest was kept, or edited since
+    return data
+
+
+def write_day_file(filename, data, entry):
+    """Replace a day file atomically, unless it already holds exactly data. Returns whether it changed."""
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        size = None
+    if size == len(data):
+        if entry is not None:
+            if entry["sha256"] == digest:
+                return False
+        else:
+            with open(filename, 'rb') as f:
+                if f.read() == data:
+                    return False
+
+    temp_path = filename + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, filename)
+    return True
+
+
 def export_messages(messages, full_export=False):
-    """Export messages to markdown files organized by conversation and date."""
+    """Export messages to markdown files organized by conversation and date.
+
+    Day files are rebuilt on a full export; otherwise the messages are new ones
+    and go after the content the manifest recorded for their day, so exporting
+    them again after an interrupted run doesn't add them twice. Only files whose
+    content changed are written, each atomically.
+
+    Returns the manifest entries for the new content, which commit_export() saves
+    along with the fingerprints of the exported messages.
+    """
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -395,46 +929,404 @@ def export_messages(messages, full_export=False):
         date_str = msg['timestamp'].strftime("%Y-%m-%d")
         time_str = msg['timestamp'].strftime("%H:%M")
 
+        text = msg['text']
+        if msg.get('attachment_files'):
+            # Link saved MMS attachments, relative to the conversation folder
+            text += " " + " ".join(f"[{os.path.basename(path)}](../{path})" for path in msg['attachment_files'])
+
         conversations[conv_name_clean][date_str].append({
             "time": time_str,
             "sender": msg['sender'],
-            "text": msg['text']
+            "text": text
         })
 
-    # Write files
+    # Build every day file's new content
+    manifest = load_markdown_manifest()
+    days = []
+    bases_changed = False
     messages_written = 0
 
     for conv_name, dates in conversations.items():
-        conv_dir = os.path.join(OUTPUT_DIR, conv_name)
-        os.makedirs(conv_dir, exist_ok=True)
-
         for date_str, msgs in dates.items():
-            filename = os.path.join(conv_dir, f"{date_str}.md")
+            filename = os.path.join(OUTPUT_DIR, conv_name, f"{date_str}.md")
+            key = f"{conv_name}/{date_str}"
+
+            base = None if full_export else existing_day_content(filename, manifest.get(key))
+            if base is None:
+                base = f"# Messages with {conv_name} - {date_str}\n\n".encode('utf-8')
+            if not full_export:
+                entry = {"day": key, "size": len(base), "sha256": hashlib.sha256(base).hexdigest()}
+                if manifest.get(key) != entry:
+                    manifest[key] = entry
+                    bases_changed = True
+            lines = "".join(f"**{msg['time']} - {msg['sender']}:** {msg['text']}\n\n" for msg in msgs)
+            days.append((filename, key, base + lines.encode('utf-8')))
+            messages_written += len(msgs)
+
+    # The manifest records the content each day's new messages go after before any
+    # file changes, so an interrupted run rebuilds the same files. (An interrupted
+    # full export starts over, see main().)
+    if bases_changed:
+        save_markdown_manifest(manifest)
+
+    # Write files
+    new_entries = {}
+    files_written = 0
+    for filename, key, data in days:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        # Outside a full export the entry now describes the base, so compare with the file itself
+        if write_day_file(filename, data, manifest.get(key) if full_export else None):
+            files_written += 1
+        new_entries[key] = {"day": key, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+    print(f"Exported {messages_written} messages to {len(conversations)} conversation folders ({files_written} day files changed)")
+
+    return new_entries
+
+
+class JsonStreamWriter:
+    """Writes a JSON object whose last key is a list (e.g. messages), one item at a time.
+
+    Pass the header fields to write_header() to stream items straight to the file,
+    or to close() when they are only known at the end; items are then spooled to a
+    temp file and copied in after the header. With indent=None the output is compact,
+    one item per line.
+    """
+
+    def __init__(self, path, list_key="messages", indent=2):
+        self.path = path
+        self.list_key = list_key
+        self.indent = indent
+        self.file = None
+        self.spool = None
+        self.count = 0
+
+    def _encode(self, value):
+        if self.indent is None:
+            return json.dumps(value, separators=(",", ":"))
+        return json.dumps(value, indent=self.indent)
+
+    def write_header(self, header):
+        """Open the output file and write the header fields and the start of the list."""
+        self.file = open(self.path, 'w', encoding='utf-8')
+        # Drop the closing brace so the list can follow the header fields
+        key = json.dumps(self.list_key)
+        if self.indent is None:
+            self.file.write(self._encode(header)[:-1] + f',{key}:[')
+        else:
+            self.file.write(self._encode(header)[:-2] + f',\n{" " * self.indent}{key}: [')
+
+    def write_item(self, item):
+        if self.file is None and self.spool is None:
+            self.spool = tempfile.TemporaryFile('w+', encoding='utf-8', dir=os.path.dirname(self.path) or ".")
+        out = self.file if self.file is not None else self.spool
+
+        out.write(",\n" if self.count else "\n")
+        if self.indent is None:
+            out.write(self._encode(item))
+        else:
+            # Indent to line up with the list
+            out.write(textwrap.indent(self._encode(item), " " * (self.indent * 2)))
+        self.count += 1
+
+    def close(self, header=None):
+        """Finish the file, writing the header first if write_header() wasn't called."""
+        if self.file is None:
+            self.write_header(header)
+            if self.spool is not None:
+                self.spool.seek(0)
+                shutil.copyfileobj(self.spool, self.file)
+                self.spool.close()
+
+        if self.indent is None:
+            self.file.write("\n]}" if self.count else "]}")
+        else:
+            self.file.write(f'\n{" " * self.indent}]\n}}' if self.count else "]\n}")
+        self.file.close()
+
+
+class DatabaseSink:
+    """Writes every message into desmond.db, a SQLite database with a full-text index.
+
+    Messages are keyed by (source, source_id), so exporting a message again
+    updates its row instead of adding a copy.
+    """
+
+    def __init__(self, output_dir, source):
+        self.db_path = os.path.join(output_dir, "desmond.db")
+        self.source = source
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(DB_SCHEMA)
+        try:
+            self.conn.executescript(DB_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # This Python's SQLite was built without FTS5; the indexed columns still work
+            self.has_fts = False
+        self.conversation_ids = {}
+        self.sender_ids = {}
+        self.pending = []
+        self.total_messages = 0
+
+    def conversation_id(self, name, conv_type):
+        if name not in self.conversation_ids:
+            self.conn.execute(
+                "INSERT INTO conversations (source, name, type) VALUES (?, ?, ?) "
+                "ON CONFLICT (source, name) DO UPDATE SET type = excluded.type",
+                (self.source, name, conv_type)
+            )
+            self.conversation_ids[name] = self.conn.execute(
+                "SELECT id FROM conversations WHERE source = ? AND name = ?", (self.source, name)
+            ).fetchone()[0]
+        return self.conversation_ids[name]
+
+    def sender_id(self, name):
+        if name not in self.sender_ids:
+            self.conn.execute("INSERT OR IGNORE INTO senders (name) VALUES (?)", (name,))
+            self.sender_ids[name] = self.conn.execute(
+                "SELECT id FROM senders WHERE name = ?", (name,)
+            ).fetchone()[0]
+        return self.sender_ids[name]
+
+    def add(self, source_id, record):
+        self.pending.append((
+            self.source,
+            source_id,
+            self.conversation_id(record["conversation"], record["conversation_type"]),
+            self.sender_id(record["sender"]),
+            record["timestamp"],
+            int(record["is_from_me"]),
+            record["message_type"],
+            record["text"],
+            ",".join(record["attachment_types"]),
+            record["reaction"],
+            record["special_content"],
+            record["effect"],
+            record.get("source")
+        ))
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany(DB_UPSERT_MESSAGE, self.pending)
+        self.total_messages += len(self.pending)
+        self.pending.clear()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+        print(f"Updated {self.total_messages} messages in {self.db_path}")
+        if not self.has_fts:
+            print("  (Full-text search is unavailable: this Python's SQLite has no FTS5)")
+
+
+class ExportStats:
+    """Running totals for SUMMARY.md and the messages.json header, fed one record at a time."""
+
+    def __init__(self):
+        self.total_messages = 0
+        self.type_counts = defaultdict(int)
+        self.source_counts = defaultdict(int)
+        self.attachment_counts = defaultdict(int)
+        self.special_content_counts = defaultdict(int)
+        self.conversations = {}
+        self.first_date = None
+        self.last_date = None
+
+    def add(self, record):
+        self.total_messages += 1
+        self.type_counts[record["message_type"]] += 1
+        if record.get("source"):
+            self.source_counts[record["source"]] += 1
+        # Count messages (not attachments) per attachment type
+        for category in set(record["attachment_types"]):
+            self.attachment_counts[category] += 1
+        if record["special_content"]:
+            self.special_content_counts[record["special_content"]] += 1
+        if self.first_date is None:
+            self.first_date = record["date"]
+        self.last_date = record["date"]
+
+        # Track conversation metadata
+        conv_name = record["conversation"]
+        if conv_name not in self.conversations:
+            self.conversations[conv_name] = {
+                "name": conv_name,
+                "type": record["conversation_type"],
+                "message_count": 0,
+                "first_message": record["timestamp"],
+                "last_message": record["timestamp"]
+            }
+        self.conversations[conv_name]["message_count"] += 1
+        self.conversations[conv_name]["last_message"] = record["timestamp"]
+
+    def top_conversations(self, limit=20):
+        return sorted(self.conversations.values(), key=lambda x: x["message_count"], reverse=True)[:limit]
+
+
+def message_fingerprint(msg):
+    """Stable id for a message, so the same message from two backups is stored once.
+
+    Built from the backup's raw date and type/msg_box attributes, so it doesn't
+    change with the computer's time zone.
+    """
+    key = "|".join([
+        msg.get('source', 'sms'),
+        msg.get('address') or "",
+        str(msg['raw_date']),
+        str(msg['raw_type']),
+        msg['text'] or ""
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class FingerprintIndex:
+    """The set of messages already exported, stored as raw message_fingerprint() digests.
+
+    The file is a flat run of fixed-size digests, so it loads into a set in one
+    read and new fingerprints are appended once an export has finished. With
+    path=None nothing is kept on disk, which still drops duplicates within a run;
+    with reset=True the file on disk is ignored and replaced on save().
+    """
+
+    DIGEST_SIZE = 20  # SHA-1
+
+    def __init__(self, path=None, reset=False):
+        self.path = path
+        self.reset = reset
+        self.seen = set()
+        self.added = []
+        if path and not reset and os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Ignore a digest cut short by an interrupted save
+            end = len(data) - len(data) % self.DIGEST_SIZE
+            self.seen = {data[i:i + self.DIGEST_SIZE] for i in range(0, end, self.DIGEST_SIZE)}
+
+    def select_new(self, messages):
+        """Return the messages not seen before, remembering them for save()."""
+        new_messages = []
+        for msg in messages:
+            if not msg.get('timestamp'):
+                continue
+            digest = bytes.fromhex(message_fingerprint(msg))
+            if digest in self.seen:
+                continue
+            self.seen.add(digest)
+            self.added.append(digest)
+            new_messages.append(msg)
+        return new_messages
+
+    def add(self, digests):
+        """Remember digests that aren't in the index yet, e.g. from an export journal."""
+        for digest in digests:
+            if digest not in self.seen:
+                self.seen.add(digest)
+                self.added.append(digest)
+
+    def pending(self):
+        """The digests save() will write."""
+        return sorted(self.seen) if self.reset else list(self.added)
+
+    def save(self):
+        """Append the new fingerprints to the file, or rewrite it after a reset."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.reset:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(b"".join(self.seen))
+            os.replace(temp_path, self.path)
+        else:
+            with open(self.path, 'ab') as f:
+                f.write(b"".join(self.added))
+        self.added = []
+        self.reset = False
+
+
+def commit_export(manifest_entries, fingerprints):
+    """Save the new markdown manifest entries and message fingerprints as one step.
+
+    Both go into EXPORT_JOURNAL_FILE first, so if either save is interrupted,
+    finish_export_commit() completes them on the next run. Until then the messages
+    count as new, and the manifest still holds the content they go after.
+    """
+    journal = {
+        "manifest": manifest_entries,
+        "reset": fingerprints.reset,
+        "fingerprints": [digest.hex() for digest in fingerprints.pending()]
+    }
+    os.makedirs(os.path.dirname(EXPORT_JOURNAL_FILE), exist_ok=True)
+    temp_path = EXPORT_JOURNAL_FILE + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(journal, f)
+    os.replace(temp_path, EXPORT_JOURNAL_FILE)
+
+    if manifest_entries:
+        manifest = load_markdown_manifest()
+        manifest.update(manifest_entries)
+        save_markdown_manifest(manifest)
+    fingerprints.save()
+    os.remove(EXPORT_JOURNAL_FILE)
+
+
+def finish_export_commit():
+    """Complete a commit_export() that an earlier run didn't finish."""
+    if not os.path.exists(EXPORT_JOURNAL_FILE):
+        return
+    with open(EXPORT_JOURNAL_FILE, 'r', encoding='utf-8') as f:
+        journal = json.load(f)
 
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f"# Messages with {conv_name} - {date_str}\n\n")
+    if journal["manifest"]:
+        manifest = load_markdown_manifest()
+        manifest.update(journal["manifest"])
+        save_markdown_manifest(manifest)
+    fingerprints = FingerprintIndex(FINGERPRINT_FILE, reset=journal["reset"])
+    fingerprints.add(bytes.fromhex(digest) for digest in journal["fingerprints"])
+    fingerprints.save()
+    os.remove(EXPORT_JOURNAL_FILE)
 
-                for msg in msgs:
-                    f.write(f"**{msg['time']} - {msg['sender']}:** {msg['text']}\n\n")
-                    messages_written += 1
 
-    print(f"Exported {messages_written} messages to {len(conversations)} conversation folders")
+def call_key(call):
+    """Identify a call log entry, so the same call from two backups is exported once."""
+    return (call['number'], call['timestamp'], call['type'], call['duration_seconds'])
 
-    return conversations
 
+def backup_signature(filepath):
+    """Path, size and modification time, to tell whether a backup changed since it was read."""
+    stat = os.stat(filepath)
+    return {"path": os.path.abspath(filepath), "size": stat.st_size, "mtime": stat.st_mtime}
 
-def export_ai_ready(messages):
-    """Export messages to AI-ready JSON and CSV formats."""
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+def export_ai_ready(messages, compact_json=False, database=False, output_dir=None):
+    """Export messages to AI-ready JSON and CSV formats, in output_dir (OUTPUT_DIR by default)."""
+    import csv
+
+    output_dir = output_dir or OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
 
     # Sort messages by timestamp
     messages = [m for m in messages if m.get('timestamp')]
     messages.sort(key=lambda x: x['timestamp'])
 
-    # Build structured records
-    all_messages = []
-    conversations_meta = {}
+    # Records are streamed to the JSON and CSV files as they're built
+    json_path = os.path.join(output_dir, "messages.json")
+    json_writer = JsonStreamWriter(json_path, indent=None if compact_json else 2)
+
+    csv_path = os.path.join(output_dir, "messages.csv")
+    csv_file = None
+    csv_writer = None
+    fieldnames = ["timestamp", "date", "time", "year", "month", "day", "hour",
+                  "day_of_week", "conversation", "conversation_type", "sender",
+                  "is_from_me", "message_type", "text", "has_attachment",
+                  "attachment_types", "reaction", "special_content", "effect",
+                  "char_count", "word_count", "source", "attachment_files"]
+
+    database_sink = DatabaseSink(OUTPUT_DIR, "android") if database else None
+
+    stats = ExportStats()
 
     for msg in messages:
         timestamp = msg['timestamp']
@@ -462,29 +1354,31 @@ def export_ai_ready(messages):
             "effect": None,
             "char_count": len(msg['text']) if msg['text'] else 0,
             "word_count": len(msg['text'].split()) if msg['text'] else 0,
-            "source": msg.get('source', 'sms')
+            "source": msg.get('source', 'sms'),
+            "attachment_files": msg.get('attachment_files', [])
         }
 
-        all_messages.append(record)
+        json_writer.write_item(record)
 
-        # Track conversation metadata
-        if conv_name not in conversations_meta:
-            conversations_meta[conv_name] = {
-                "name": conv_name,
-                "type": "direct",
-                "message_count": 0,
-                "first_message": timestamp.isoformat(),
-                "last_message": timestamp.isoformat()
-            }
-        conversations_meta[conv_name]["message_count"] += 1
-        conversations_meta[conv_name]["last_message"] = timestamp.isoformat()
+        if csv_writer is None:
+            csv_file = open(csv_path, 'w', newline='', encoding='utf-8')
+            csv_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+            csv_writer.writeheader()
+        msg_copy = record.copy()
+        msg_copy["attachment_types"] = ",".join(msg_copy["attachment_types"]) if msg_copy["attachment_types"] else ""
+        msg_copy["attachment_files"] = ",".join(msg_copy["attachment_files"])
+        csv_writer.writerow(msg_copy)
 
-    # Calculate stats
-    sms_count = sum(1 for m in all_messages if m.get('source') == 'sms')
-    mms_count = sum(1 for m in all_messages if m.get('source') == 'mms')
-    text_count = sum(1 for m in all_messages if m["message_type"] == "text")
-    attachment_count = sum(1 for m in all_messages if m["message_type"] == "attachment")
-    text_att_count = sum(1 for m in all_messages if m["message_type"] == "text_with_attachment")
+        if database_sink is not None:
+            database_sink.add(message_fingerprint(msg), record)
+
+        stats.add(record)
+
+    sms_count = stats.source_counts["sms"]
+    mms_count = stats.source_counts["mms"]
+    text_count = stats.type_counts["text"]
+    attachment_count = stats.type_counts["attachment"]
+    text_att_count = stats.type_counts["text_with_attachment"]
 
     print(f"\nMessage breakdown:")
     print(f"  - SMS messages:       {sms_count:,}")
@@ -492,63 +1386,43 @@ def export_ai_ready(messages):
     print(f"  - Text only:          {text_count:,}")
     print(f"  - Attachments only:   {attachment_count:,}")
     print(f"  - Text + attachment:  {text_att_count:,}")
-    print(f"  - Total:              {len(all_messages):,}")
+    print(f"  - Total:              {stats.total_messages:,}")
 
-    # Write JSON
-    json_path = os.path.join(OUTPUT_DIR, "messages.json")
-    export_data = {
+    # Finish JSON
+    json_writer.close({
         "export_date": datetime.now().isoformat(),
         "source": "Android SMS Backup & Restore",
-        "total_messages": len(all_messages),
-        "total_conversations": len(conversations_meta),
-        "conversations": list(conversations_meta.values()),
-        "messages": all_messages
-    }
-
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(export_data, f, indent=2)
+        "total_messages": stats.total_messages,
+        "total_conversations": len(stats.conversations),
+        "conversations": list(stats.conversations.values())
+    })
 
     print(f"\nCreated {json_path}")
 
-    # Write CSV
-    csv_path = os.path.join(OUTPUT_DIR, "messages.csv")
-
-    if all_messages:
-        fieldnames = ["timestamp", "date", "time", "year", "month", "day", "hour",
-                      "day_of_week", "conversation", "conversation_type", "sender",
-                      "is_from_me", "message_type", "text", "has_attachment",
-                      "attachment_types", "reaction", "special_content", "effect",
-                      "char_count", "word_count", "source"]
-
-        import csv
-        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for msg in all_messages:
-                msg_copy = msg.copy()
-                msg_copy["attachment_types"] = ",".join(msg_copy["attachment_types"]) if msg_copy["attachment_types"] else ""
-                writer.writerow(msg_copy)
-
+    # Finish CSV
+    if csv_file is not None:
+        csv_file.close()
         print(f"Created {csv_path}")
 
+    if database_sink is not None:
+        database_sink.close()
+
     # Write summary
-    summary_path = os.path.join(OUTPUT_DIR, "SUMMARY.md")
+    summary_path = os.path.join(output_dir, "SUMMARY.md")
 
-    photos = sum(1 for m in all_messages if "photo" in m.get("attachment_types", []))
-    videos = sum(1 for m in all_messages if "video" in m.get("attachment_types", []))
-    audio = sum(1 for m in all_messages if "audio" in m.get("attachment_types", []))
+    photos = stats.attachment_counts["photo"]
+    videos = stats.attachment_counts["video"]
+    audio = stats.attachment_counts["audio"]
 
     with open(summary_path, 'w', encoding='utf-8') as f:
         f.write("# Android SMS Export Summary\n\n")
         f.write(f"**Export Date:** {datetime.now().strftime('%Y-%m-%d %H:%M')}\n")
         f.write(f"**Source:** SMS Backup & Restore app\n")
-        f.write(f"**Total Messages:** {len(all_messages):,}\n")
-        f.write(f"**Total Conversations:** {len(conversations_meta)}\n\n")
+        f.write(f"**Total Messages:** {stats.total_messages:,}\n")
+        f.write(f"**Total Conversations:** {len(stats.conversations)}\n\n")
 
-        if all_messages:
-            first_date = all_messages[0]["date"]
-            last_date = all_messages[-1]["date"]
-            f.write(f"**Date Range:** {first_date} to {last_date}\n\n")
+        if stats.first_date:
+            f.write(f"**Date Range:** {stats.first_date} to {stats.last_date}\n\n")
 
         f.write("## Message Types\n\n")
         f.write(f"- **SMS messages:** {sms_count:,}\n")
@@ -563,8 +1437,7 @@ def export_ai_ready(messages):
         f.write(f"- **Audio:** {audio:,}\n\n")
 
         f.write("## Top 20 Conversations (by message count)\n\n")
-        sorted_convos = sorted(conversations_meta.values(), key=lambda x: x["message_count"], reverse=True)[:20]
-        for conv in sorted_convos:
+        for conv in stats.top_conversations(20):
             f.write(f"- **{conv['name']}**: {conv['message_count']:,} messages\n")
 
         f.write("\n## Files\n\n")
@@ -576,43 +1449,42 @@ def export_ai_ready(messages):
     print(f"Created {summary_path}")
 
 
-def export_call_logs(call_logs):
-    """Export call logs to JSON and CSV."""
+def export_call_logs(call_logs, compact_json=False, output_dir=None):
+    """Export call logs to JSON and CSV, in output_dir (OUTPUT_DIR by default)."""
     if not call_logs:
         return
 
+    output_dir = output_dir or OUTPUT_DIR
+
     # Sort by timestamp
     call_logs = [c for c in call_logs if c.get('timestamp')]
     call_logs.sort(key=lambda x: x['timestamp'])
 
     # Write JSON
-    json_path = os.path.join(OUTPUT_DIR, "call_logs.json")
+    json_path = os.path.join(output_dir, "call_logs.json")
 
-    export_data = {
+    json_writer = JsonStreamWriter(json_path, list_key="calls", indent=None if compact_json else 2)
+    json_writer.write_header({
         "export_date": datetime.now().isoformat(),
-        "total_calls": len(call_logs),
-        "calls": [
-            {
-                "timestamp": c['timestamp'].isoformat(),
-                "date": c['timestamp'].strftime("%Y-%m-%d"),
-                "time": c['timestamp'].strftime("%H:%M:%S"),
-                "contact": c['contact'],
-                "number": c['number'],
-                "type": c['type'],
-                "duration_seconds": c['duration_seconds'],
-                "duration_formatted": f"{c['duration_seconds'] // 60}:{c['duration_seconds'] % 60:02d}"
-            }
-            for c in call_logs
-        ]
-    }
-
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(export_data, f, indent=2)
+        "total_calls": len(call_logs)
+    })
+    for c in call_logs:
+        json_writer.write_item({
+            "timestamp": c['timestamp'].isoformat(),
+            "date": c['timestamp'].strftime("%Y-%m-%d"),
+            "time": c['timestamp'].strftime("%H:%M:%S"),
+            "contact": c['contact'],
+            "number": c['number'],
+            "type": c['type'],
+            "duration_seconds": c['duration_seconds'],
+            "duration_formatted": f"{c['duration_seconds'] // 60}:{c['duration_seconds'] % 60:02d}"
+        })
+    json_writer.close()
 
     print(f"Created {json_path}")
 
     # Write CSV
-    csv_path = os.path.join(OUTPUT_DIR, "call_logs.csv")
+    csv_path = os.path.join(output_dir, "call_logs.csv")
 
     import csv
     with open(csv_path, 'w', newline='', encoding='utf-8') as f:
@@ -639,12 +1511,39 @@ def main():
     print()
 
     full_export = "--full" in sys.argv
+    compact_json = "--compact-json" in sys.argv
+    # Once desmond.db exists, every run keeps it up to date
+    database = "--db" in sys.argv or os.path.exists(os.path.join(OUTPUT_DIR, "desmond.db"))
+    # Likewise for saved MMS attachments
+    attachments_dir = os.path.join(OUTPUT_DIR, "attachments")
+    if "--attachments" not in sys.argv and not os.path.isdir(attachments_dir):
+        attachments_dir = None
     custom_file = None
+    filters = {}
+    workers = 1
 
-    # Check for custom file path
+    # Check for custom file path and filters
     for i, arg in enumerate(sys.argv):
-        if arg == "--file" and i + 1 < len(sys.argv):
+        if i + 1 >= len(sys.argv):
+            break
+        if arg == "--file":
             custom_file = sys.argv[i + 1]
+        elif arg == "--workers":
+            try:
+                workers = int(sys.argv[i + 1])
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print("Error: --workers needs a number of processes, 1 or more (e.g. --workers 4)")
+                sys.exit(1)
+        elif arg in ("--since", "--until"):
+            try:
+                filters[arg[2:]] = datetime.strptime(sys.argv[i + 1], "%Y-%m-%d")
+            except ValueError:
+                print(f"Error: {arg} needs a date like 2024-01-31")
+                sys.exit(1)
+        elif arg in ("--conversation", "--sender"):
+            filters[arg[2:]] = sys.argv[i + 1]
 
     # Find or use specified backup file
     if custom_file:
@@ -672,35 +1571,103 @@ def main():
         print("  python android_sms_exporter.py --file \"path/to/backup.xml\"")
         sys.exit(1)
 
-    # Use the most recent backup
-    backup_file = backup_files[0]["path"]
-    print(f"\nUsing backup: {backup_file}")
+    state = load_state()
+    finish_export_commit()
+    if not filters and not full_export and not os.path.exists(FINGERPRINT_FILE):
+        # Nothing records what earlier exports wrote, so start over
+        if os.path.exists(STATE_FILE):
+            print("\nNo record of which messages were exported before, so everything will be exported again.")
+        full_export = True
+    processed_files = [] if full_export else state.get("processed_files", [])
+    resume_points = [] if full_export else state.get("resume_points", [])
+    # A targeted export only drops duplicates within the run and leaves the index alone
+    fingerprints = FingerprintIndex(None if filters else FINGERPRINT_FILE, reset=full_export)
+
+    # Read every backup, oldest first, keeping only messages not exported before
+    messages = []
+    call_logs = []
+    call_keys = set()
+    found = 0
+    skipped = 0
+    for backup in reversed(backup_files):
+        backup_file = backup["path"]
+        signature = backup_signature(backup_file)
+        if not filters and signature in processed_files:
+            print(f"\nSkipping {backup_file} (unchanged since the last export)")
+            skipped += 1
+            continue
 
-    # Parse the backup
-    messages, call_logs = parse_sms_backup(backup_file)
+        # A backup that extends one read before only needs its new records parsed
+        byte_range = None if filters else find_resume_range(backup_file, resume_points)
+        if byte_range and byte_range[0] >= byte_range[1]:
+            print(f"\nSkipping {backup_file} (no records that weren't in an earlier backup)")
+            processed_files = [f for f in processed_files if f["path"] != signature["path"]] + [signature]
+            skipped += 1
+            continue
+        backup_messages, backup_calls = parse_sms_backup(backup_file, filters=filters, workers=workers,
+                                                         attachments_dir=attachments_dir, byte_range=byte_range,
+                                                         exported=fingerprints.seen)
+
+        found += len(backup_messages) + len(backup_calls)
+        new_messages = fingerprints.select_new(backup_messages)
+        if len(new_messages) < len(backup_messages):
+            print(f"  {len(new_messages)} of them are new")
+        messages.extend(new_messages)
+
+        for call in backup_calls:
+            if call.get('timestamp') and call_key(call) not in call_keys:
+                call_keys.add(call_key(call))
+                call_logs.append(call)
+
+        # A backup that failed to parse comes back empty; try it again next time
+        if not filters and (backup_messages or backup_calls):
+            processed_files = [f for f in processed_files if f["path"] != signature["path"]] + [signature]
+            point = resume_point(backup_file)
+            if point:
+                resume_points = [p for p in resume_points if p["head"] != point["head"]] + [point]
 
     if not messages:
-        print("\nNo messages found in backup file.")
-        sys.exit(1)
+        if filters:
+            print("\nNo messages match the filters.")
+            sys.exit(1)
+        if not found and not skipped:
+            print("\nNo messages found in backup file.")
+            sys.exit(1)
+        print("\nNo new messages since the last export.")
 
     # Export
-    print("\nExporting messages...")
-    export_messages(messages, full_export=full_export)
-
-    print("\nCreating AI-ready exports...")
-    export_ai_ready(messages)
+    manifest_entries = {}
+    # A targeted export only writes the JSON, CSV and summary of its slice, to
+    # their own folder; the full export's files and desmond.db keep the whole history
+    output_dir = os.path.join(OUTPUT_DIR, "filtered") if filters else OUTPUT_DIR
+    if filters:
+        print("\nExporting only the messages that match the filters...")
+        export_ai_ready(messages, compact_json=compact_json, output_dir=output_dir)
+    elif messages:
+        if full_export and os.path.exists(FINGERPRINT_FILE):
+            # The day files are rebuilt from scratch, so until the new index is
+            # saved an interrupted run has to start over as well
+            os.remove(FINGERPRINT_FILE)
+        print("\nExporting messages...")
+        manifest_entries = export_messages(messages, full_export=full_export)
+
+        print("\nCreating AI-ready exports...")
+        export_ai_ready(messages, compact_json=compact_json, database=database)
 
     if call_logs:
         print(f"\nExporting {len(call_logs)} call logs...")
-        export_call_logs(call_logs)
+        export_call_logs(call_logs, compact_json=compact_json, output_dir=output_dir)
 
     print(f"\nExport complete! Files saved to:")
-    print(f"  {OUTPUT_DIR}")
+    print(f"  {output_dir}")
 
     # Save state
-    state = load_state()
+    if not filters:
+        commit_export(manifest_entries, fingerprints)
+        state["processed_files"] = processed_files
+        state["resume_points"] = resume_points
     state["last_export"] = datetime.now().isoformat()
-    state["last_file"] = backup_file
+    state["last_file"] = backup_files[0]["path"]
     save_state(state)
 
 
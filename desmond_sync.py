@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Desmond Sync Driver
+Keeps pushing "Sync Now" in Messages until your iCloud history has downloaded.
+
+Progress is tracked with MAX(ROWID) on chat.db, which is a single index lookup,
+instead of counting the whole message table on every check. The check interval
+backs off while nothing is arriving, and the ingest rate gives an ETA when you
+pass a target message count.
+
+Usage: python3 desmond_sync.py [TARGET_MESSAGES]
+"""
+
+import sqlite3
+import os
+import sys
+import time
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+# Configuration
+MESSAGES_DB = os.path.expanduser("~/Library/Messages/chat.db")
+BASE_INTERVAL = 15  # Seconds between checks while messages are arriving
+MAX_INTERVAL = 120  # Longest wait between checks once growth has stalled
+MAX_STALLS = 4  # Checks in a row with no new messages before calling it done
+STATUS_EVERY = 180  # Seconds between detailed status reports
+RATE_SMOOTHING = 0.3  # Weight of the latest check in the ingest rate average
+
+SYNC_NOW_SCRIPT = """
+tell application "Messages" to activate
+delay 0.3
+tell application "System Events"
+    tell process "Messages"
+        keystroke "," using command down
+        delay 0.5
+        try
+            click button "Sync Now" of group 1 of group 1 of window "iMessage"
+            delay 0.2
+        end try
+    end tell
+end tell
+"""
+
+
+def log(message=""):
+    """Print a message with a timestamp, like the rest of Desmond's output."""
+    if message:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+    else:
+        print(flush=True)
+
+
+def format_duration(seconds):
+    """Format a number of seconds as e.g. '2h 05m' or '4m 30s'."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def open_messages_db():
+    """Open chat.db read-only; Messages keeps writing to it while we watch."""
+    return sqlite3.connect(Path(MESSAGES_DB).as_uri() + "?mode=ro", uri=True)
+
+
+def max_rowid(conn):
+    """Highest message ROWID, read from the end of the table's B-tree."""
+    return conn.execute("SELECT MAX(ROWID) FROM message").fetchone()[0] or 0
+
+
+def message_count(conn):
+    """Exact number of messages; a full scan, so only used to confirm estimates."""
+    return conn.execute("SELECT COUNT(*) FROM message").fetchone()[0]
+
+
+def conversation_count(conn):
+    """Number of chats (the chat table is small, unlike chat_message_join)."""
+    return conn.execute("SELECT COUNT(*) FROM chat").fetchone()[0]
+
+
+def push_sync_now():
+    """Click Messages > Settings > iMessage > Sync Now."""
+    subprocess.run(["osascript", "-e", SYNC_NOW_SCRIPT], capture_output=True)
+
+
+class SyncProgress:
+    """Message count, smoothed ingest rate and stall tracking between checks."""
+
+    def __init__(self, start_count, start_rowid, target=None):
+        self.start_count = start_count
+        self.start_rowid = start_rowid
+        self.rowid = start_rowid
+        self.count = start_count
+        self.target = target
+        self.rate = None  # Messages per second (exponentially weighted)
+        self.stalls = 0
+        self.interval = BASE_INTERVAL
+        self.last_time = time.monotonic()
+
+    def update(self, rowid):
+        """Record a check and return how many messages arrived since the last one."""
+        now = time.monotonic()
+        # New messages always get higher ROWIDs, so growth in MAX(ROWID) counts them
+        # without another full COUNT(*)
+        new_count = self.start_count + (rowid - self.start_rowid)
+        added = max(new_count - self.count, 0)
+        elapsed = max(now - self.last_time, 1e-6)
+        self.count = max(new_count, self.count)
+        self.rowid = rowid
+        self.last_time = now
+
+        latest_rate = added / elapsed
+        if self.rate is None:
+            self.rate = latest_rate
+        else:
+            self.rate = RATE_SMOOTHING * latest_rate + (1 - RATE_SMOOTHING) * self.rate
+
+        if added:
+            self.stalls = 0
+            self.interval = BASE_INTERVAL
+        else:
+            # Back off while nothing is arriving
+            self.stalls += 1
+            self.interval = min(self.interval * 2, MAX_INTERVAL)
+        return added
+
+    def recount(self, count):
+        """Replace the ROWID-based estimate with an exact COUNT(*).
+
+        Deleted messages and ROWID gaps make the estimate run ahead of the real count.
+        """
+        self.start_count = count
+        self.start_rowid = self.rowid
+        self.count = count
+
+    def remaining(self):
+        return max(self.target - self.count, 0) if self.target else None
+
+    def eta(self):
+        """Seconds until the target at the current rate, or None if unknown."""
+        if not self.target or not self.rate:
+            return None
+        return self.remaining() / self.rate
+
+    def describe_rate(self):
+        if not self.rate:
+            return ""
+        text = f"~{self.rate * 60:,.0f}/min"
+        eta = self.eta()
+        if eta is not None:
+            text += f", ETA {format_duration(eta)}"
+        return f" [{text}]"
+
+
+def main():
+    target = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+    if not os.path.exists(MESSAGES_DB):
+        print(f"Messages database not found: {MESSAGES_DB}")
+        print("Make sure Terminal has Full Disk Access.")
+        sys.exit(1)
+
+    if target:
+        print(f"  Target: {target:,} messages")
+        print()
+    print("  Press Control + C to stop.")
+    print()
+
+    conn = open_messages_db()
+
+    # One full count to start from; after this only MAX(ROWID) is read
+    start_count = message_count(conn)
+    progress = SyncProgress(start_count, max_rowid(conn), target)
+    conversations = conversation_count(conn)
+
+    log("====== STARTING ======")
+    log(f"Messages on Mac: {progress.count:,}")
+    log(f"Conversations: {conversations:,}")
+    if target:
+        log(f"Remaining: ~{progress.remaining():,} messages")
+    log("========================")
+    log()
+
+    push = 1
+    last_status = time.monotonic()
+
+    try:
+        while True:
+            if target and progress.count >= target:
+                # Confirm with one full count before declaring the target reached
+                progress.recount(message_count(conn))
+            if target and progress.count >= target:
+                log()
+                log("====== SYNC COMPLETE ======")
+                log(f"Reached target: {progress.count:,} messages")
+                log('"See you in another life, brother."')
+                log()
+                return
+
+            push_sync_now()
+            time.sleep(progress.interval)
+            push += 1
+
+            added = progress.update(max_rowid(conn))
+            if added:
+                log(f"Push #{push} - +{added:,} new messages (total: {progress.count:,}){progress.describe_rate()}")
+            elif progress.stalls < MAX_STALLS:
+                log(f"Push #{push} - No new messages (check {progress.stalls}/{MAX_STALLS}, next in {progress.interval}s)")
+            else:
+                log(f"Push #{push} - No new messages (check {progress.stalls}/{MAX_STALLS})")
+
+                conversations = conversation_count(conn)
+                log()
+                log("====== SYNC APPEARS COMPLETE ======")
+                log(f"No new messages for {MAX_STALLS} checks.")
+                log(f"Final count: {progress.count:,} messages in {conversations:,} conversations")
+                log()
+                log("If this seems low, run again with your target:")
+                log("  ./desmond.sh 344254")
+                log()
+                log('"See you in another life, brother."')
+                log()
+                return
+
+            if time.monotonic() - last_status >= STATUS_EVERY:
+                last_status = time.monotonic()
+                conversations = conversation_count(conn)
+                log()
+                log("====== THE NUMBERS ======")
+                log(f"Messages on Mac: {progress.count:,}")
+                log(f"Conversations: {conversations:,}")
+                if target:
+                    log(f"Progress: {progress.count * 100 // target}% (~{progress.remaining():,} remaining)")
+                if progress.rate:
+                    log(f"Rate: ~{progress.rate * 60:,.0f} messages/min")
+                    if progress.eta() is not None:
+                        log(f"ETA: {format_duration(progress.eta())}")
+                log("===========================")
+                log()
+    except KeyboardInterrupt:
+        log()
+        log(f"Stopped at {progress.count:,} messages.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -14,11 +14,18 @@ import sqlite3
 import os
 import json
 import re
+import hashlib
 import shutil
+import csv
+import copy
+import tempfile
+import textwrap
+import time
 import plistlib
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, defaultdict, namedtuple
 
 # Configuration - Default Windows backup locations
 BACKUP_LOCATIONS = [
@@ -38,10 +45,24 @@ CONTACTS_DB_HASH = "31bb7ba8914766d4ba40d6dfb6113c8b614be442"
 # Output configuration
 OUTPUT_DIR = os.path.expanduser("~/Documents/iMessages_Export")
 STATE_FILE = os.path.join(OUTPUT_DIR, ".export_state.json")
+CONTACTS_CACHE_FILE = os.path.join(OUTPUT_DIR, ".contacts_cache.json")
+BATCH_SIZE = 5000  # Messages read from the database and written out at a time
 
 # Global contact lookup cache
 CONTACTS_CACHE = {}
 
+# Global handle lookup cache (handle ROWID -> (phone/email, contact name))
+HANDLES_CACHE = {}
+
+# Global chat lookup cache (chat ROWID -> (conversation name, conversation type))
+CHATS_CACHE = {}
+
+# Distinct phone numbers/emails whose contact name is remembered by lookup_contact_name
+CONTACT_LOOKUP_CACHE_SIZE = 4096
+
+# Strips everything but digits from a phone number
+NON_DIGITS = re.compile(r'\D')
+
 
 def find_backup_directory():
     """Find the most recent iPhone backup directory."""
@@ -94,10 +115,178 @@ def find_backup_directory():
     return backups_found[0]["path"]
 
 
+def open_source_db(path, immutable=False):
+    """Open a source database read-only, in place, without copying it.
+
+    Pass immutable=True for files nothing else writes to (like backups) so SQLite
+    skips locking entirely. If the file can't be opened in place, it's snapshotted
+    with the SQLite backup API into a private temp file instead. Returns
+    (connection, snapshot_path); pass both to close_source_db() when done.
+    """
+    uri = Path(os.path.abspath(path)).as_uri()
+    try:
+        conn = sqlite3.connect(uri + ("?mode=ro&immutable=1" if immutable else "?mode=ro"), uri=True)
+        # Connecting is lazy, so read the schema to surface lock and permission errors now
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        return conn, None
+    except sqlite3.OperationalError as e:
+        print(f"  Could not open {path} in place ({e}), using a snapshot instead")
+
+    # immutable=1 doesn't need the -shm file, which mode=ro can fail to create
+    fd, snapshot_path = tempfile.mkstemp(prefix="desmond_", suffix=".db")
+    os.close(fd)
+    source = sqlite3.connect(uri + "?mode=ro&immutable=1", uri=True)
+    conn = sqlite3.connect(snapshot_path)
+    source.backup(conn)
+    source.close()
+    return conn, snapshot_path
+
+
+def close_source_db(conn, snapshot_path):
+    """Close a connection from open_source_db() and remove its snapshot, if any."""
+    conn.close()
+    if snapshot_path:
+        os.remove(snapshot_path)
+
+
+def source_fingerprint(path):
+    """Identify the current version of a SQLite file by its size, mtime and header page, plus its WAL."""
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        header_hash = hashlib.sha1(f.read(4096)).hexdigest()
+    fingerprint = [stat.st_size, stat.st_mtime_ns, header_hash]
+    # Recent changes can sit in the write-ahead log without touching the main file
+    wal_path = path + "-wal"
+    if os.path.exists(wal_path):
+        wal_stat = os.stat(wal_path)
+        fingerprint += [wal_stat.st_size, wal_stat.st_mtime_ns]
+    return fingerprint
+
+
+def check_for_new_messages(db_path, state, immutable=False):
+    """Cheaply tell whether the database has messages past the last exported ROWID.
+
+    Returns (has_new, fingerprint). If the file's fingerprint matches the one saved
+    by the last run nothing has been written since; otherwise MAX(ROWID) is compared
+    with the last exported ROWID. Nothing else is loaded either way.
+    """
+    fingerprint = source_fingerprint(db_path)
+    if fingerprint == state.get("source_fingerprint"):
+        return False, fingerprint
+
+    conn, snapshot_path = open_source_db(db_path, immutable=immutable)
+    max_rowid = conn.execute("SELECT MAX(ROWID) FROM message").fetchone()[0] or 0
+    close_source_db(conn, snapshot_path)
+    return max_rowid > state.get("last_message_rowid", 0), fingerprint
+
+
+def truncate_file(path, size):
+    """Cut a file back to size bytes, or remove it if size is None (it didn't exist yet)."""
+    if size is None:
+        if os.path.exists(path):
+            os.remove(path)
+    elif os.path.exists(path):
+        with open(path, 'r+b') as f:
+            f.truncate(size)
+
+
+def file_size(path):
+    """Size of a file in bytes, or None if it doesn't exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def load_contacts_cache():
+    """Load the contact maps saved by the last run, keyed by contacts database path."""
+    if os.path.exists(CONTACTS_CACHE_FILE):
+        try:
+            with open(CONTACTS_CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {}
+
+
+def save_contacts_cache(sources):
+    """Save each contacts database's fingerprint and contact map for the next run."""
+    os.makedirs(os.path.dirname(CONTACTS_CACHE_FILE), exist_ok=True)
+    with open(CONTACTS_CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(sources, f, separators=(",", ":"))
+
+
+def read_contacts_db(db_file):
+    """Read the phone number and email to name mappings from the backup's contacts database."""
+    contacts = {}
+
+    # Backup files don't change underneath us
+    conn, snapshot_path = open_source_db(db_file, immutable=True)
+    cursor = conn.cursor()
+
+    # Get phone numbers with contact names
+    try:
+        cursor.execute("""
+            SELECT
+                ABPerson.First,
+                ABPerson.Last,
+                ABMultiValue.value
+            FROM ABPerson
+            LEFT JOIN ABMultiValue ON ABPerson.ROWID = ABMultiValue.record_id
+            WHERE ABMultiValue.property = 3
+        """)
+
+        for row in cursor.fetchall():
+            first_name, last_name, phone = row
+            name_parts = [p for p in [first_name, last_name] if p]
+            if name_parts and phone:
+                name = " ".join(name_parts)
+                # Normalize phone number (remove all non-digits)
+                normalized_phone = NON_DIGITS.sub('', phone)
+                # Store with last 10 digits as key (handles country code variations)
+                if len(normalized_phone) >= 10:
+                    contacts[normalized_phone[-10:]] = name
+                if normalized_phone:
+                    contacts[normalized_phone] = name
+    except Exception as e:
+        print(f"  Phone lookup error: {e}")
+
+    # Get email addresses with contact names
+    try:
+        cursor.execute("""
+            SELECT
+                ABPerson.First,
+                ABPerson.Last,
+                ABMultiValue.value
+            FROM ABPerson
+            LEFT JOIN ABMultiValue ON ABPerson.ROWID = ABMultiValue.record_id
+            WHERE ABMultiValue.property = 4
+        """)
+
+        for row in cursor.fetchall():
+            first_name, last_name, email = row
+            name_parts = [p for p in [first_name, last_name] if p]
+            if name_parts and email:
+                contacts[email.lower()] = " ".join(name_parts)
+    except Exception as e:
+        print(f"  Email lookup error: {e}")
+
+    close_source_db(conn, snapshot_path)
+
+    return contacts
+
+
 def load_contacts(backup_dir):
-    """Load contacts from the iPhone backup."""
+    """Load contacts from the iPhone backup.
+
+    The contacts are cached in CONTACTS_CACHE_FILE and only re-read when the
+    backup's contacts database has changed since the last run.
+    """
     global CONTACTS_CACHE
 
+    # Names resolved against the old contacts are stale
+    lookup_contact_name.cache_clear()
+
     print("Loading contacts from backup...")
 
     contacts_db = os.path.join(backup_dir, CONTACTS_DB_HASH)
@@ -107,82 +296,38 @@ def load_contacts(backup_dir):
         return
 
     try:
-        # Copy database to temp location to avoid lock issues
-        temp_db = os.path.join(os.environ.get("TEMP", "/tmp"), "contacts_temp.db")
-        shutil.copy2(contacts_db, temp_db)
-
-        conn = sqlite3.connect(temp_db)
-        cursor = conn.cursor()
-
-        # Get phone numbers with contact names
-        try:
-            cursor.execute("""
-                SELECT
-                    ABPerson.First,
-                    ABPerson.Last,
-                    ABMultiValue.value
-                FROM ABPerson
-                LEFT JOIN ABMultiValue ON ABPerson.ROWID = ABMultiValue.record_id
-                WHERE ABMultiValue.property = 3
-            """)
-
-            for row in cursor.fetchall():
-                first_name, last_name, phone = row
-                name_parts = [p for p in [first_name, last_name] if p]
-                if name_parts and phone:
-                    name = " ".join(name_parts)
-                    # Normalize phone number (remove all non-digits)
-                    normalized_phone = re.sub(r'\D', '', phone)
-                    # Store with last 10 digits as key (handles country code variations)
-                    if len(normalized_phone) >= 10:
-                        CONTACTS_CACHE[normalized_phone[-10:]] = name
-                    if normalized_phone:
-                        CONTACTS_CACHE[normalized_phone] = name
-        except Exception as e:
-            print(f"  Phone lookup error: {e}")
-
-        # Get email addresses with contact names
-        try:
-            cursor.execute("""
-                SELECT
-                    ABPerson.First,
-                    ABPerson.Last,
-                    ABMultiValue.value
-                FROM ABPerson
-                LEFT JOIN ABMultiValue ON ABPerson.ROWID = ABMultiValue.record_id
-                WHERE ABMultiValue.property = 4
-            """)
-
-            for row in cursor.fetchall():
-                first_name, last_name, email = row
-                name_parts = [p for p in [first_name, last_name] if p]
-                if name_parts and email:
-                    CONTACTS_CACHE[email.lower()] = " ".join(name_parts)
-        except Exception as e:
-            print(f"  Email lookup error: {e}")
-
-        conn.close()
-
-        # Clean up temp file
-        os.remove(temp_db)
-
+        fingerprint = source_fingerprint(contacts_db)
+        cached = load_contacts_cache().get(contacts_db)
+        if cached and cached["fingerprint"] == fingerprint:
+            CONTACTS_CACHE.update(cached["contacts"])
+            print("  (Contacts unchanged since last run, read from cache)")
+        else:
+            contacts = read_contacts_db(contacts_db)
+            CONTACTS_CACHE.update(contacts)
+            save_contacts_cache({contacts_db: {"fingerprint": fingerprint, "contacts": contacts}})
     except Exception as e:
         print(f"  Error reading contacts: {e}")
 
     print(f"  Loaded {len(CONTACTS_CACHE)} contact mappings.")
 
 
+@lru_cache(maxsize=CONTACT_LOOKUP_CACHE_SIZE)
 def lookup_contact_name(identifier):
-    """Look up a contact name from phone number or email."""
+    """Look up a contact name from phone number or email.
+
+    Each distinct identifier is normalized and resolved once; later calls are
+    answered from the cache (see lookup_contact_name.cache_info()).
+    """
     if not identifier:
         return "Unknown"
 
     # Try direct match (for emails)
-    if identifier.lower() in CONTACTS_CACHE:
-        return CONTACTS_CACHE[identifier.lower()]
+    lowered = identifier.lower()
+    if lowered in CONTACTS_CACHE:
+        return CONTACTS_CACHE[lowered]
 
     # Try phone number lookup
-    normalized = re.sub(r'\D', '', identifier)
+    normalized = NON_DIGITS.sub('', identifier)
     if normalized in CONTACTS_CACHE:
         return CONTACTS_CACHE[normalized]
 
@@ -194,39 +339,37 @@ def lookup_contact_name(identifier):
     return identifier
 
 
-def get_contact_name(handle_id, cursor):
-    """Get the phone number or email for a handle, then look up contact name."""
-    cursor.execute("SELECT id FROM handle WHERE ROWID = ?", (handle_id,))
-    result = cursor.fetchone()
-    if result:
-        return lookup_contact_name(result[0])
-    return "Unknown"
-
-
-def get_chat_participants(chat_id, cursor):
-    """Get participant names for a group chat."""
-    # First get the chat ROWID from the chat_identifier
-    cursor.execute("SELECT ROWID FROM chat WHERE chat_identifier = ?", (chat_id,))
-    chat_row = cursor.fetchone()
-    if not chat_row:
-        return None
+def load_handles(cursor):
+    """Load the handle table once and resolve each handle to a contact name."""
+    if HANDLES_CACHE:
+        return
 
-    chat_rowid = chat_row[0]
+    cursor.execute("SELECT ROWID, id FROM handle")
+    for handle_rowid, identifier in cursor.fetchall():
+        HANDLES_CACHE[handle_rowid] = (identifier, lookup_contact_name(identifier))
 
-    # Get all handles (participants) for this chat
-    cursor.execute("""
-        SELECT handle.id
-        FROM handle
-        JOIN chat_handle_join ON handle.ROWID = chat_handle_join.handle_id
-        WHERE chat_handle_join.chat_id = ?
-    """, (chat_rowid,))
 
+def get_contact_name(handle_id, cursor):
+    """Get the phone number or email for a handle, then look up contact name."""
+    handle = HANDLES_CACHE.get(handle_id)
+    if handle is None:
+        # Handle was created after the cache was loaded
+        cursor.execute("SELECT id FROM handle WHERE ROWID = ?", (handle_id,))
+        result = cursor.fetchone()
+        if not result:
+            return "Unknown"
+        handle = (result[0], lookup_contact_name(result[0]))
+        HANDLES_CACHE[handle_id] = handle
+    return handle[1]
+
+
+def format_participants(identifiers):
+    """Build a short conversation name from a group chat's participants."""
     participants = []
-    for row in cursor.fetchall():
-        handle_id = row[0]
-        name = lookup_contact_name(handle_id)
+    for identifier in identifiers:
+        name = lookup_contact_name(identifier)
         # Only add if we got a real name (not the phone number back)
-        if name and name != handle_id:
+        if name and name != identifier:
             participants.append(name)
         elif name:
             # Got phone number back, abbreviate it
@@ -241,6 +384,72 @@ def get_chat_participants(chat_id, cursor):
     return None
 
 
+def load_chats(cursor, chat_rowid=None):
+    """Load chats with their participants in one query and resolve each chat's name and type.
+
+    Pass chat_rowid to load a single chat that was created after the cache was loaded.
+    """
+    if chat_rowid is None and CHATS_CACHE:
+        return
+
+    query = """
+        SELECT
+            chat.ROWID,
+            chat.chat_identifier,
+            chat.display_name,
+            handle.id
+        FROM chat
+        LEFT JOIN chat_handle_join ON chat.ROWID = chat_handle_join.chat_id
+        LEFT JOIN handle ON chat_handle_join.handle_id = handle.ROWID
+    """
+    if chat_rowid is None:
+        cursor.execute(query + " ORDER BY chat.ROWID, handle.ROWID")
+    else:
+        cursor.execute(query + " WHERE chat.ROWID = ? ORDER BY handle.ROWID", (chat_rowid,))
+
+    chats = {}
+    if chat_rowid is not None:
+        # Remember chats that no longer exist so they are only looked up once
+        CHATS_CACHE[chat_rowid] = None
+    participants_by_chat = defaultdict(list)
+    for rowid, chat_id, display_name, handle_identifier in cursor.fetchall():
+        chats[rowid] = (chat_id, display_name)
+        if handle_identifier is not None:
+            participants_by_chat[rowid].append(handle_identifier)
+
+    for rowid, (chat_id, display_name) in chats.items():
+        if display_name:
+            CHATS_CACHE[rowid] = (display_name, "group")
+        elif chat_id:
+            # First try to look up as a contact (for 1:1 chats)
+            conv_name = lookup_contact_name(chat_id)
+            # If we got back the same thing (no match), try getting group participants
+            if conv_name == chat_id or conv_name.startswith("chat"):
+                participants = format_participants(participants_by_chat[rowid])
+                if participants:
+                    CHATS_CACHE[rowid] = (participants, "group")
+                else:
+                    CHATS_CACHE[rowid] = (chat_id, "unknown")
+            else:
+                CHATS_CACHE[rowid] = (conv_name, "direct")
+        else:
+            # No usable chat info, name the conversation after the sender
+            CHATS_CACHE[rowid] = None
+
+
+def get_conversation(chat_rowid, handle_id, cursor):
+    """Get the conversation name and type for a message."""
+    if chat_rowid is not None:
+        if chat_rowid not in CHATS_CACHE:
+            load_chats(cursor, chat_rowid)
+        chat = CHATS_CACHE.get(chat_rowid)
+        if chat:
+            return chat
+
+    conv_name = get_contact_name(handle_id, cursor) if handle_id else "Unknown"
+    return conv_name, "direct"
+
+
 def convert_apple_time(apple_timestamp):
     """Convert Apple's timestamp format to readable datetime."""
     if apple_timestamp is None:
@@ -250,6 +459,11 @@ def convert_apple_time(apple_timestamp):
     return datetime.fromtimestamp(unix_timestamp)
 
 
+def to_apple_time(dt):
+    """Convert a local datetime to Apple's timestamp format."""
+    return int((dt.timestamp() - 978307200) * 1_000_000_000)
+
+
 def load_state():
     """Load the last export state."""
     if os.path.exists(STATE_FILE):
@@ -259,216 +473,1268 @@ def load_state():
 
 
 def save_state(state):
-    """Save the export state."""
+    """Save the export state, replacing the old file in one step so a crash can't leave it half written."""
     os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
-    with open(STATE_FILE, 'w') as f:
+    temp_path = STATE_FILE + ".tmp"
+    with open(temp_path, 'w') as f:
         json.dump(state, f)
+    os.replace(temp_path, STATE_FILE)
 
 
-def export_messages(messages_db_path, full_export=False):
-    """Export messages to markdown files."""
-
-    # Create output directory
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    # Load state
-    state = load_state()
-    last_rowid = 0 if full_export else state.get("last_message_rowid", 0)
+def export_sink_names(archive=False, database=False):
+    """Names of the sinks build_sinks() creates, which key their watermarks in the state file."""
+    names = ["stats", "markdown", "index", "json", "csv", "summary"]
+    if archive:
+        names.append("archive")
+    if database:
+        names.append("database")
+    return names
 
-    # Copy database to temp location (iPhone backup files may be locked)
-    temp_db = os.path.join(os.environ.get("TEMP", "/tmp"), "messages_temp.db")
-    shutil.copy2(messages_db_path, temp_db)
 
-    # Connect to database
-    conn = sqlite3.connect(temp_db)
-    cursor = conn.cursor()
+def sink_watermarks(state, names, full_export=False):
+    """The last chat.db ROWID each named sink has committed.
 
-    # Get messages with attachment and reaction info
-    query = """
-    SELECT
-        message.ROWID,
-        message.text,
-        message.date,
-        message.is_from_me,
-        message.handle_id,
-        message.associated_message_type,
-        chat.chat_identifier,
-        chat.display_name
-    FROM message
-    LEFT JOIN chat_message_join ON message.ROWID = chat_message_join.message_id
-    LEFT JOIN chat ON chat_message_join.chat_id = chat.ROWID
-    WHERE message.ROWID > ?
-    ORDER BY message.date ASC
+    State files from before per-sink watermarks only have last_message_rowid, which
+    every existing output was kept in step with. A sink without a watermark starts
+    from the beginning, so a newly added archive or database gets the whole history.
     """
+    if full_export:
+        return {name: 0 for name in names}
+    if "sinks" not in state:
+        last_rowid = state.get("last_message_rowid", 0)
+        existing = {
+            "archive": os.path.isdir(os.path.join(OUTPUT_DIR, "archive")),
+            "database": os.path.exists(os.path.join(OUTPUT_DIR, "desmond.db"))
+        }
+        return {name: last_rowid if existing.get(name, True) else 0 for name in names}
+    return {name: state["sinks"].get(name, 0) for name in names}
+
+
+# Reaction type mapping (markdown labels)
+MARKDOWN_REACTION_TYPES = {
+    2000: "loved",
+    2001: "liked",
+    2002: "disliked",
+    2003: "laughed at",
+    2004: "emphasized",
+    2005: "questioned",
+    3000: "removed love from",
+    3001: "removed like from",
+    3002: "removed dislike from",
+    3003: "removed laugh from",
+    3004: "removed emphasis from",
+    3005: "removed question from"
+}
+
+# Markdown labels for attachment categories
+MARKDOWN_ATTACHMENT_LABELS = {
+    "photo": "photo",
+    "video": "video",
+    "audio": "audio"
+}
+
+# Start of each message in a markdown day file
+MARKDOWN_MESSAGE = re.compile(rb'^\*\*\d\d:\d\d - ', re.M)
+
+# A markdown day file's name
+MARKDOWN_DAY_FILE = re.compile(r'^\d{4}-\d\d-\d\d\.md$')
+
+# Reaction type mapping (JSON/CSV labels)
+REACTION_TYPES = {
+    2000: "loved",
+    2001: "liked",
+    2002: "disliked",
+    2003: "laughed",
+    2004: "emphasized",
+    2005: "questioned",
+    3000: "removed love",
+    3001: "removed like",
+    3002: "removed dislike",
+    3003: "removed laugh",
+    3004: "removed emphasis",
+    3005: "removed question"
+}
+
+# Special message type mapping (balloon_bundle_id)
+SPECIAL_TYPES = {
+    "com.apple.Handwriting.HandwritingProvider": "handwritten message",
+    "com.apple.DigitalTouchBalloonProvider": "Digital Touch",
+    "com.apple.messages.MSMessageExtensionBalloonPlugin:0000000000:com.apple.icloud.apps.messages.business.extension": "business chat",
+    "com.apple.messages.URLBalloonProvider": "link preview",
+    "com.apple.Stickers.UserGenerated.MessagesExtension": "sticker",
+    "com.apple.messages.MSMessageExtensionBalloonPlugin": "app message",
+}
+
+# Expressive send styles
+EXPRESSIVE_STYLES = {
+    "com.apple.MobileSMS.expressivesend.gentle": "sent gently",
+    "com.apple.MobileSMS.expressivesend.impact": "sent with slam",
+    "com.apple.MobileSMS.expressivesend.loud": "sent loud",
+    "com.apple.MobileSMS.expressivesend.invisibleink": "sent with invisible ink",
+    "com.apple.messages.effect.CKEchoEffect": "sent with echo",
+    "com.apple.messages.effect.CKSpotlightEffect": "sent with spotlight",
+    "com.apple.messages.effect.CKHappyBirthdayEffect": "sent with balloons",
+    "com.apple.messages.effect.CKHeartEffect": "sent with heart",
+    "com.apple.messages.effect.CKLasersEffect": "sent with lasers",
+    "com.apple.messages.effect.CKFireworksEffect": "sent with fireworks",
+    "com.apple.messages.effect.CKShootingStarEffect": "sent with shooting star",
+    "com.apple.messages.effect.CKSparklesEffect": "sent with celebration",
+    "com.apple.messages.effect.CKConfettiEffect": "sent with confetti",
+}
+
+# Columns written to messages.csv (and keys of every message record)
+CSV_FIELDNAMES = ["timestamp", "date", "time", "year", "month", "day", "hour",
+                  "day_of_week", "conversation", "conversation_type", "sender",
+                  "is_from_me", "message_type", "text", "has_attachment",
+                  "attachment_types", "reaction", "special_content", "effect",
+                  "char_count", "word_count"]
+
+# Local search database (desmond.db)
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT,
+    UNIQUE (source, name)
+);
+CREATE TABLE IF NOT EXISTS senders (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id),
+    sender_id INTEGER NOT NULL REFERENCES senders (id),
+    timestamp TEXT NOT NULL,
+    is_from_me INTEGER NOT NULL,
+    message_type TEXT,
+    text TEXT,
+    attachment_types TEXT,
+    reaction TEXT,
+    special_content TEXT,
+    effect TEXT,
+    service TEXT,
+    UNIQUE (source, source_id)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender_id, timestamp);
+"""
 
-    cursor.execute(query, (last_rowid,))
-    messages = cursor.fetchall()
+# Full-text index over messages.text, kept in sync by triggers
+DB_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (text, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
 
-    if not messages:
-        print("No new messages to export.")
-        conn.close()
-        os.remove(temp_db)
-        return
+DB_UPSERT_MESSAGE = """
+INSERT INTO messages (source, source_id, conversation_id, sender_id, timestamp, is_from_me,
+                      message_type, text, attachment_types, reaction, special_content, effect, service)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source, source_id) DO UPDATE SET
+    conversation_id = excluded.conversation_id,
+    sender_id = excluded.sender_id,
+    timestamp = excluded.timestamp,
+    is_from_me = excluded.is_from_me,
+    message_type = excluded.message_type,
+    text = excluded.text,
+    attachment_types = excluded.attachment_types,
+    reaction = excluded.reaction,
+    special_content = excluded.special_content,
+    effect = excluded.effect,
+    service = excluded.service
+"""
 
-    # Get all attachments
-    cursor.execute("""
-        SELECT
-            message_attachment_join.message_id,
-            attachment.mime_type,
-            attachment.transfer_name
-        FROM attachment
-        JOIN message_attachment_join ON attachment.ROWID = message_attachment_join.attachment_id
-    """)
+# A decoded message: chat.db ROWID and GUID, the JSON/CSV record and its markdown line text (None to skip)
+ExportRow = namedtuple("ExportRow", ["rowid", "guid", "record", "markdown"])
+
+
+def load_attachments(cursor, message_ids):
+    """Load attachment metadata for the given message ROWIDs, grouped by message."""
+    rows = []
+    message_ids = list(message_ids)
+    # Query in chunks to stay under SQLite's limit on bound parameters
+    for start in range(0, len(message_ids), 500):
+        chunk = message_ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f"""
+            SELECT
+                message_attachment_join.message_id,
+                attachment.filename,
+                attachment.mime_type,
+                attachment.transfer_name
+            FROM attachment
+            JOIN message_attachment_join ON attachment.ROWID = message_attachment_join.attachment_id
+            WHERE message_attachment_join.message_id IN ({placeholders})
+            ORDER BY attachment.ROWID
+        """, chunk)
+        rows.extend(cursor.fetchall())
 
     attachments_by_msg = defaultdict(list)
-    for row in cursor.fetchall():
-        msg_id, mime_type, transfer_name = row
+    for row in rows:
+        msg_id, filename, mime_type, transfer_name = row
+        att_info = {
+            "filename": transfer_name or (filename.split('/')[-1] if filename else None),
+            "transfer_name": transfer_name,
+            "type": mime_type
+        }
+        # Categorize attachment
         if mime_type:
             if mime_type.startswith('image'):
-                attachments_by_msg[msg_id].append("photo")
+                att_info["category"] = "photo"
             elif mime_type.startswith('video'):
-                attachments_by_msg[msg_id].append("video")
+                att_info["category"] = "video"
             elif mime_type.startswith('audio'):
-                attachments_by_msg[msg_id].append("audio")
+                att_info["category"] = "audio"
             else:
-                attachments_by_msg[msg_id].append(f"{transfer_name or 'file'}")
-
-    # Reaction type mapping
-    reaction_types = {
-        2000: "loved",
-        2001: "liked",
-        2002: "disliked",
-        2003: "laughed at",
-        2004: "emphasized",
-        2005: "questioned",
-        3000: "removed love from",
-        3001: "removed like from",
-        3002: "removed dislike from",
-        3003: "removed laugh from",
-        3004: "removed emphasis from",
-        3005: "removed question from"
+                att_info["category"] = "file"
+        else:
+            att_info["category"] = "file"
+
+        attachments_by_msg[msg_id].append(att_info)
+
+    return attachments_by_msg
+
+
+def describe_special_content(balloon_bundle_id):
+    """Describe an app/special message from its balloon bundle id."""
+    # Try to identify the specific type
+    for bundle_key, bundle_name in SPECIAL_TYPES.items():
+        if bundle_key in balloon_bundle_id:
+            return bundle_name
+
+    bundle_lower = balloon_bundle_id.lower()
+    if "gamepigeon" in bundle_lower:
+        return "GamePigeon game"
+    elif "pay" in bundle_lower or "wallet" in bundle_lower:
+        return "Apple Pay"
+    elif "fitness" in bundle_lower:
+        return "Fitness sharing"
+    elif "music" in bundle_lower:
+        return "Apple Music"
+    elif "photo" in bundle_lower:
+        return "shared photo"
+    return f"app content ({balloon_bundle_id.split('.')[-1] if '.' in balloon_bundle_id else 'unknown'})"
+
+
+def decode_message(row, attachments_by_msg, cursor):
+    """Decode one message row into an ExportRow shared by every sink."""
+    rowid, text, date, is_from_me, handle_id, assoc_msg_type, balloon_bundle_id, expressive_style, chat_rowid, guid = row
+
+    # Get timestamp
+    msg_datetime = convert_apple_time(date)
+    if msg_datetime is None:
+        return None
+
+    # Get conversation name
+    conv_name, conv_type = get_conversation(chat_rowid, handle_id, cursor)
+
+    # Get sender name - for group chats, get the actual sender's name
+    if is_from_me:
+        sender = "Me"
+    else:
+        sender = get_contact_name(handle_id, cursor) if handle_id else conv_name
+
+    # Determine message type and content
+    msg_type = "text"
+    content = text
+    attachments = attachments_by_msg.get(rowid, [])
+    reaction = None
+    special_content = None
+    effect = None
+
+    # Check for expressive send style
+    if expressive_style and expressive_style in EXPRESSIVE_STYLES:
+        effect = EXPRESSIVE_STYLES[expressive_style]
+
+    # Check for reaction
+    if assoc_msg_type and assoc_msg_type in REACTION_TYPES:
+        msg_type = "reaction"
+        reaction = REACTION_TYPES[assoc_msg_type]
+        content = f"{reaction}" if not text else text
+    # Check for attachment
+    elif attachments:
+        if text:
+            msg_type = "text_with_attachment"
+        else:
+            msg_type = "attachment"
+            # Describe the attachment
+            content = " ".join(f"[{att['category']}]" for att in attachments)
+    # Check for special message types
+    elif not text and balloon_bundle_id:
+        msg_type = "special"
+        special_content = describe_special_content(balloon_bundle_id)
+        content = f"[{special_content}]"
+    elif not text:
+        # No text, no attachment, no balloon - likely system message or empty
+        msg_type = "special"
+        content = "[unknown message type]"
+
+    # Build message record
+    record = {
+        "timestamp": msg_datetime.isoformat(),
+        "date": msg_datetime.strftime("%Y-%m-%d"),
+        "time": msg_datetime.strftime("%H:%M:%S"),
+        "year": msg_datetime.year,
+        "month": msg_datetime.month,
+        "day": msg_datetime.day,
+        "hour": msg_datetime.hour,
+        "day_of_week": msg_datetime.strftime("%A"),
+        "conversation": conv_name,
+        "conversation_type": conv_type,
+        "sender": sender,
+        "is_from_me": bool(is_from_me),
+        "message_type": msg_type,
+        "text": content,
+        "has_attachment": len(attachments) > 0,
+        "attachment_types": [a["category"] for a in attachments] if attachments else [],
+        "reaction": reaction,
+        "special_content": special_content,
+        "effect": effect,
+        "char_count": len(content) if content else 0,
+        "word_count": len(content.split()) if content else 0
     }
 
-    # Organize messages by conversation and date
-    conversations = defaultdict(lambda: defaultdict(list))
-    max_rowid = last_rowid
+    # Build the markdown line (attachments without a MIME type are left out)
+    md_attachments = [MARKDOWN_ATTACHMENT_LABELS.get(a["category"], f"{a['transfer_name'] or 'file'}")
+                      for a in attachments if a["type"]]
+    if assoc_msg_type and assoc_msg_type in MARKDOWN_REACTION_TYPES:
+        markdown = f"*{MARKDOWN_REACTION_TYPES[assoc_msg_type]} a message*"
+    elif text and md_attachments:
+        markdown = f"{text} [{', '.join(md_attachments)}]"
+    elif text:
+        markdown = text
+    elif md_attachments:
+        markdown = f"[{', '.join(md_attachments)}]"
+    else:
+        # Skip empty messages
+        markdown = None
+
+    return ExportRow(rowid, guid, record, markdown)
+
+
+class ExportStats:
+    """Running totals for SUMMARY.md and the messages.json header, fed one record at a time."""
+
+    name = "stats"
+
+    def __init__(self):
+        self.total_messages = 0
+        self.type_counts = defaultdict(int)
+        self.source_counts = defaultdict(int)
+        self.attachment_counts = defaultdict(int)
+        self.special_content_counts = defaultdict(int)
+        self.conversations = {}
+        self.first_date = None
+        self.last_date = None
+
+    def add(self, record):
+        self.total_messages += 1
+        self.type_counts[record["message_type"]] += 1
+        if record.get("source"):
+            self.source_counts[record["source"]] += 1
+        # Count messages (not attachments) per attachment type
+        for category in set(record["attachment_types"]):
+            self.attachment_counts[category] += 1
+        if record["special_content"]:
+            self.special_content_counts[record["special_content"]] += 1
+        if self.first_date is None:
+            self.first_date = record["date"]
+        self.last_date = record["date"]
 
-    for row in messages:
-        rowid, text, date, is_from_me, handle_id, assoc_msg_type, chat_id, display_name = row
+        # Track conversation metadata
+        conv_name = record["conversation"]
+        if conv_name not in self.conversations:
+            self.conversations[conv_name] = {
+                "name": conv_name,
+                "type": record["conversation_type"],
+                "message_count": 0,
+                "first_message": record["timestamp"],
+                "last_message": record["timestamp"]
+            }
+        self.conversations[conv_name]["message_count"] += 1
+        self.conversations[conv_name]["last_message"] = record["timestamp"]
 
-        max_rowid = max(max_rowid, rowid)
+    def top_conversations(self, limit=20):
+        return sorted(self.conversations.values(), key=lambda x: x["message_count"], reverse=True)[:limit]
 
-        # Get conversation identifier
-        if display_name:
-            conv_name = display_name
-        elif chat_id:
-            # First try to look up as a contact (for 1:1 chats)
-            conv_name = lookup_contact_name(chat_id)
-            # If we got back the same thing (no match), try getting group participants
-            if conv_name == chat_id or conv_name.startswith("chat"):
-                participants = get_chat_participants(chat_id, cursor)
-                if participants:
-                    conv_name = participants
-                else:
-                    conv_name = chat_id
+    def write(self, row):
+        self.add(row.record)
+
+    def pending_files(self):
+        return []
+
+    def flush(self):
+        pass
+
+    def checkpoint(self):
+        return copy.deepcopy(vars(self))
+
+    def restore(self, checkpoint):
+        for key, value in checkpoint.items():
+            current = getattr(self, key)
+            if isinstance(current, defaultdict):
+                current.update(value)
+            else:
+                setattr(self, key, value)
+
+    def close(self):
+        pass
+
+
+class MarkdownSink:
+    """Writes messages to per-day markdown files, one folder per conversation.
+
+    .markdown_manifest.jsonl records the size, SHA-256 and message count of every
+    day file as written, one JSON line per update (the last line for a file wins). New
+    messages are added after the recorded content, so replaying a chunk after a
+    crash rewrites a day file rather than adding its messages twice. A full
+    export holds each day until its last message and rewrites only the files
+    whose content changed. Every file is replaced atomically.
+
+    Per-conversation totals are kept from the manifest and saved to
+    .conversations.json on close, for create_index().
+    """
+
+    name = "markdown"
+
+    def __init__(self, output_dir, full_export=False):
+        self.output_dir = output_dir
+        self.full_export = full_export
+        self.manifest_path = os.path.join(output_dir, ".markdown_manifest.jsonl")
+        self.conversations_path = os.path.join(output_dir, ".conversations.json")
+        self.manifest = {}
+        self.manifest_changed = False
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        break
+                    self.manifest[entry["day"]] = entry
+        else:
+            self.manifest = self.scan_day_files()
+            if self.manifest:
+                self.save_manifest()
+                self.manifest_changed = True
+        self.conversation_stats = {}
+        for entry in self.manifest.values():
+            self.count_day(None, entry)
+        self.pending = defaultdict(lambda: defaultdict(list))
+        # Days a full export is writing from scratch; they're held until a later day starts
+        self.fresh = set()
+        self.latest_date = None
+        self.conversations = set()
+        self.messages_written = 0
+        self.files_written = 0
+
+    def scan_day_files(self):
+        """Manifest entries for the day files of an export from before the manifest was kept.
+
+        This is the only time the conversation folders are listed.
+        """
+        manifest = {}
+        if not os.path.isdir(self.output_dir):
+            return manifest
+        for conv_name in os.listdir(self.output_dir):
+            conv_dir = os.path.join(self.output_dir, conv_name)
+            if conv_name.startswith('.') or not os.path.isdir(conv_dir):
+                continue
+            for filename in os.listdir(conv_dir):
+                if MARKDOWN_DAY_FILE.match(filename):
+                    with open(os.path.join(conv_dir, filename), 'rb') as f:
+                        data = f.read()
+                    key = f"{conv_name}/{filename[:-3]}"
+                    manifest[key] = {"day": key, "size": len(data), "sha256": hashlib.sha256(data).hexdigest(),
+                                     "messages": len(MARKDOWN_MESSAGE.findall(data))}
+        return manifest
+
+    def save_manifest(self):
+        """Rewrite the manifest atomically with one line per day file."""
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for key in sorted(self.manifest):
+                f.write(json.dumps(self.manifest[key]) + "\n")
+        os.replace(temp_path, self.manifest_path)
+
+    def count_day(self, old, entry):
+        """Update the conversation totals for a day file's manifest entry going from old to entry."""
+        conv_name, date_str = entry["day"].rsplit("/", 1)
+        stats = self.conversation_stats.get(conv_name)
+        if stats is None:
+            stats = self.conversation_stats[conv_name] = {"days": 0, "messages": 0, "first_date": date_str, "last_date": date_str}
+        if old is None:
+            stats["days"] += 1
         else:
-            conv_name = get_contact_name(handle_id, cursor) if handle_id else "Unknown"
+            stats["messages"] -= old["messages"]
+        stats["messages"] += entry["messages"]
+        stats["first_date"] = min(stats["first_date"], date_str)
+        stats["last_date"] = max(stats["last_date"], date_str)
 
+    def write(self, row):
+        if row.markdown is None:
+            return
+
+        record = row.record
         # Clean up conversation name for filename (Windows-safe)
         invalid_chars = '<>:"/\\|?*'
-        conv_name_clean = "".join(c if c not in invalid_chars and (c.isalnum() or c in (' ', '-', '_')) else '_' for c in str(conv_name))
+        conv_name_clean = "".join(c if c not in invalid_chars and (c.isalnum() or c in (' ', '-', '_')) else '_' for c in str(record["conversation"]))
         conv_name_clean = conv_name_clean.strip()
+        date_str = record["date"]
+        self.conversations.add(conv_name_clean)
+        # Rows come in date order, so a day at or past the latest one hasn't been written yet
+        if self.full_export and (self.latest_date is None or date_str >= self.latest_date):
+            self.latest_date = date_str
+            self.fresh.add((conv_name_clean, date_str))
+        self.pending[conv_name_clean][date_str].append(
+            f"**{record['time'][:5]} - {record['sender']}:** {row.markdown}\n\n"
+        )
+
+    def day_path(self, conv_name, date_str):
+        return os.path.join(self.output_dir, conv_name, f"{date_str}.md")
+
+    def pending_files(self):
+        """Files the next flush() changes in a way a crash could leave half done.
+
+        Day files in the manifest are rebuilt from their recorded content, so only
+        the manifest itself and day files it doesn't know yet need undoing.
+        """
+        if not self.pending:
+            return []
+        return [self.manifest_path] + [
+            self.day_path(conv_name, date_str)
+            for conv_name, dates in self.pending.items() for date_str in dates
+            if f"{conv_name}/{date_str}" not in self.manifest
+        ]
+
+    def existing_content(self, key, path):
+        """The content new messages for a day go after, and how many messages it holds.
+
+        That's what the manifest recorded, if it's intact. Returns (None, 0) for a
+        day file that doesn't exist yet.
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None, 0
+        entry = self.manifest.get(key)
+        if entry and len(data) >= entry["size"] and hashlib.sha256(data[:entry["size"]]).hexdigest() == entry["sha256"]:
+            return data[:entry["size"]], entry["messages"]
+        # Edited since it was written
+        return data, len(MARKDOWN_MESSAGE.findall(data))
+
+    def write_day(self, conv_name, date_str, lines):
+        """Write one day file, unless it already holds exactly this content. Returns its manifest entry."""
+        key = f"{conv_name}/{date_str}"
+        path = self.day_path(conv_name, date_str)
+        base, messages = (None, 0) if (conv_name, date_str) in self.fresh else self.existing_content(key, path)
+        if base is None:
+            base = f"# Messages with {conv_name} - {date_str}\n\n".encode('utf-8')
+        data = base + "".join(lines).encode('utf-8')
+        entry = {"day": key, "size": len(data), "sha256": hashlib.sha256(data).hexdigest(), "messages": messages + len(lines)}
+        self.messages_written += len(lines)
+
+        unchanged = file_size(path) == len(data)
+        if unchanged:
+            recorded = self.manifest.get(key)
+            if recorded is not None:
+                unchanged = recorded["sha256"] == entry["sha256"]
+            else:
+                with open(path, 'rb') as f:
+                    unchanged = f.read() == data
+        if not unchanged:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self.files_written += 1
+        return entry
+
+    def flush(self, final=False):
+        """Write the buffered days, except ones a full export may still add to unless final."""
+        entries = []
+        for conv_name, dates in self.pending.items():
+            for date_str in list(dates):
+                if not final and date_str == self.latest_date and (conv_name, date_str) in self.fresh:
+                    continue
+                entries.append(self.write_day(conv_name, date_str, dates.pop(date_str)))
+                self.fresh.discard((conv_name, date_str))
+
+        for conv_name in [conv_name for conv_name, dates in self.pending.items() if not dates]:
+            del self.pending[conv_name]
+
+        # Only days whose content changed need a new manifest line
+        entries = [entry for entry in entries if self.manifest.get(entry["day"]) != entry]
+        if entries:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                for entry in entries:
+                    self.count_day(self.manifest.get(entry["day"]), entry)
+                    self.manifest[entry["day"]] = entry
+                    f.write(json.dumps(entry) + "\n")
+            self.manifest_changed = True
+
+    def checkpoint(self):
+        return {
+            "messages_written": self.messages_written,
+            "files_written": self.files_written,
+            "conversations": sorted(self.conversations),
+            "latest_date": self.latest_date,
+            # Days a full export hasn't written yet
+            "pending": copy.deepcopy(self.pending),
+            "fresh": sorted(self.fresh)
+        }
+
+    def restore(self, checkpoint):
+        self.messages_written = checkpoint["messages_written"]
+        self.files_written = checkpoint["files_written"]
+        self.conversations = set(checkpoint["conversations"])
+        self.latest_date = checkpoint["latest_date"]
+        for conv_name, dates in checkpoint["pending"].items():
+            for date_str, lines in dates.items():
+                self.pending[conv_name][date_str] = lines
+        self.fresh = {tuple(day) for day in checkpoint["fresh"]}
+
+    def close(self):
+        self.flush(final=True)
+
+        # Keep one line per day file
+        if self.manifest_changed:
+            self.save_manifest()
+
+        if self.manifest_changed or not os.path.exists(self.conversations_path):
+            os.makedirs(self.output_dir, exist_ok=True)
+            temp_path = self.conversations_path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(sorted(self.conversation_stats.items())), f, indent=2)
+            os.replace(temp_path, self.conversations_path)
+
+        print(f"Exported {self.messages_written} messages from {len(self.conversations)} conversations "
+              f"({self.files_written} day files changed).")
 
-        # Get date
-        msg_datetime = convert_apple_time(date)
-        if msg_datetime is None:
-            continue
 
-        date_str = msg_datetime.strftime("%Y-%m-%d")
-        time_str = msg_datetime.strftime("%H:%M")
+class IndexSink:
+    """Rebuilds INDEX.md from .conversations.json once the markdown files are written."""
+
+    name = "index"
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def write(self, row):
+        pass
+
+    def pending_files(self):
+        return []
+
+    def flush(self):
+        pass
+
+    def checkpoint(self):
+        return {}
+
+    def restore(self, checkpoint):
+        pass
+
+    def close(self):
+        create_index(self.output_dir)
+
+
+class JsonStreamWriter:
+    """Writes a JSON object whose last key is a list (e.g. messages), one item at a time.
+
+    Pass the header fields to write_header() to stream items straight to the file,
+    or to close() when they are only known at the end; items are then spooled to
+    path + ".part" and copied in after the header. checkpoint() and resume() let an
+    interrupted export carry on with the same spool. The output is written to a temp
+    file and renamed into place on close(). With indent=None the output is compact,
+    one item per line.
+    """
+
+    def __init__(self, path, list_key="messages", indent=2):
+        self.path = path
+        self.temp_path = path + ".tmp"
+        self.spool_path = path + ".part"
+        self.list_key = list_key
+        self.indent = indent
+        self.file = None
+        self.spool = None
+        self.spool_size = 0
+        self.count = 0
+
+    def _encode(self, value):
+        if self.indent is None:
+            return json.dumps(value, separators=(",", ":"))
+        return json.dumps(value, indent=self.indent)
+
+    def write_header(self, header):
+        """Open the output file and write the header fields and the start of the list."""
+        self.file = open(self.temp_path, 'w', encoding='utf-8')
+        # Drop the closing brace so the list can follow the header fields
+        key = json.dumps(self.list_key)
+        if self.indent is None:
+            self.file.write(self._encode(header)[:-1] + f',{key}:[')
+        else:
+            self.file.write(self._encode(header)[:-2] + f',\n{" " * self.indent}{key}: [')
+
+    def open_spool(self):
+        if self.spool_size:
+            # Drop anything written after the checkpoint being resumed
+            truncate_file(self.spool_path, self.spool_size)
+            self.spool = open(self.spool_path, 'a+', encoding='utf-8')
+        else:
+            self.spool = open(self.spool_path, 'w+', encoding='utf-8')
+
+    def write_item(self, item):
+        if self.file is None and self.spool is None:
+            self.open_spool()
+        out = self.file if self.file is not None else self.spool
 
-        # Determine sender - for group chats, get the actual sender's name
-        if is_from_me:
-            sender = "Me"
+        out.write(",\n" if self.count else "\n")
+        if self.indent is None:
+            out.write(self._encode(item))
         else:
-            sender = get_contact_name(handle_id, cursor) if handle_id else conv_name
-
-        # Build message content
-        attachments = attachments_by_msg.get(rowid, [])
-
-        # Check for reaction
-        if assoc_msg_type and assoc_msg_type in reaction_types:
-            content = f"*{reaction_types[assoc_msg_type]} a message*"
-        elif text and attachments:
-            content = f"{text} [{', '.join(attachments)}]"
-        elif text:
-            content = text
-        elif attachments:
-            content = f"[{', '.join(attachments)}]"
+            # Indent to line up with the list
+            out.write(textwrap.indent(self._encode(item), " " * (self.indent * 2)))
+        self.count += 1
+
+    def checkpoint(self):
+        """Flush the spool and return what resume() needs to carry on from here."""
+        if self.spool is not None:
+            self.spool.flush()
+            self.spool_size = os.path.getsize(self.spool_path)
+        return {"count": self.count, "spool_size": self.spool_size}
+
+    def resume(self, checkpoint):
+        """Continue the spool left behind by an interrupted export."""
+        self.count = checkpoint["count"]
+        self.spool_size = checkpoint["spool_size"]
+
+    def close(self, header=None):
+        """Finish the file, writing the header first if write_header() wasn't called."""
+        if self.file is None:
+            if self.spool is None and self.spool_size:
+                self.open_spool()
+            self.write_header(header)
+            if self.spool is not None:
+                self.spool.seek(0)
+                shutil.copyfileobj(self.spool, self.file)
+                self.spool.close()
+                os.remove(self.spool_path)
+
+        if self.indent is None:
+            self.file.write("\n]}" if self.count else "]}")
         else:
-            # Skip empty messages
-            continue
+            self.file.write(f'\n{" " * self.indent}]\n}}' if self.count else "]\n}")
+        self.file.close()
+        os.replace(self.temp_path, self.path)
 
-        conversations[conv_name_clean][date_str].append({
-            "time": time_str,
-            "sender": sender,
-            "text": content
+
+class JsonSink:
+    """Writes messages.json with conversation metadata and every message record."""
+
+    name = "json"
+
+    def __init__(self, output_dir, stats, compact=False):
+        self.json_path = os.path.join(output_dir, "messages.json")
+        self.stats = stats
+        # Compact output skips the indentation, which roughly halves the file size
+        self.writer = JsonStreamWriter(self.json_path, indent=None if compact else 2)
+
+    def write(self, row):
+        self.writer.write_item(row.record)
+
+    def pending_files(self):
+        return []
+
+    def flush(self):
+        pass
+
+    def checkpoint(self):
+        return self.writer.checkpoint()
+
+    def restore(self, checkpoint):
+        self.writer.resume(checkpoint)
+
+    def close(self):
+        # The conversations block comes before the messages, so it's written last
+        self.writer.close({
+            "export_date": datetime.now().isoformat(),
+            "total_messages": self.writer.count,
+            "total_conversations": len(self.stats.conversations),
+            "conversations": list(self.stats.conversations.values())
         })
 
-    # Write to files
-    messages_written = 0
+        print(f"\nCreated {self.json_path}")
 
-    for conv_name, dates in conversations.items():
-        conv_dir = os.path.join(OUTPUT_DIR, conv_name)
-        os.makedirs(conv_dir, exist_ok=True)
 
-        for date_str, msgs in dates.items():
-            filename = os.path.join(conv_dir, f"{date_str}.md")
+class CsvSink:
+    """Writes messages.csv for spreadsheets.
 
-            # Append to existing file or create new
-            mode = 'a' if os.path.exists(filename) else 'w'
+    Rows go to messages.csv.part, which is renamed into place on close().
+    """
 
-            with open(filename, mode, encoding='utf-8') as f:
-                if mode == 'w':
-                    f.write(f"# Messages with {conv_name} - {date_str}\n\n")
+    name = "csv"
+
+    def __init__(self, output_dir):
+        self.csv_path = os.path.join(output_dir, "messages.csv")
+        self.part_path = self.csv_path + ".part"
+        self.part_size = 0
+        self.file = None
+        self.writer = None
+
+    def write(self, row):
+        # Only create the file once there is something to write
+        if self.writer is None:
+            if self.part_size:
+                # Carry on after the last checkpoint of an interrupted export
+                truncate_file(self.part_path, self.part_size)
+                self.file = open(self.part_path, 'a', newline='', encoding='utf-8')
+                self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDNAMES)
+            else:
+                self.file = open(self.part_path, 'w', newline='', encoding='utf-8')
+                self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDNAMES)
+                self.writer.writeheader()
+
+        # Convert attachment_types list to string for CSV
+        msg_copy = row.record.copy()
+        msg_copy["attachment_types"] = ",".join(msg_copy["attachment_types"]) if msg_copy["attachment_types"] else ""
+        self.writer.writerow(msg_copy)
+
+    def pending_files(self):
+        return []
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def checkpoint(self):
+        if self.file is not None:
+            self.file.flush()
+            self.part_size = os.path.getsize(self.part_path)
+        return {"part_size": self.part_size}
+
+    def restore(self, checkpoint):
+        self.part_size = checkpoint["part_size"]
+
+    def close(self):
+        if self.file is None:
+            if not self.part_size:
+                return
+            truncate_file(self.part_path, self.part_size)
+        else:
+            self.file.close()
 
-                for msg in msgs:
-                    f.write(f"**{msg['time']} - {msg['sender']}:** {msg['text']}\n\n")
-                    messages_written += 1
+        os.replace(self.part_path, self.csv_path)
+        print(f"Created {self.csv_path}")
+
+
+class SummarySink:
+    """Prints the message breakdown and writes SUMMARY.md."""
+
+    name = "summary"
+
+    def __init__(self, output_dir, stats):
+        self.summary_path = os.path.join(output_dir, "SUMMARY.md")
+        self.stats = stats
+
+    def write(self, row):
+        pass
+
+    def pending_files(self):
+        return []
+
+    def flush(self):
+        pass
+
+    def checkpoint(self):
+        return {}
+
+    def restore(self, checkpoint):
+        pass
+
+    def close(self):
+        stats = self.stats
+
+        # Calculate stats
+        text_msgs = stats.type_counts["text"]
+        attachment_msgs = stats.type_counts["attachment"]
+        text_with_att = stats.type_counts["text_with_attachment"]
+        reactions = stats.type_counts["reaction"]
+        special_msgs = stats.type_counts["special"]
+
+        photos = stats.attachment_counts["photo"]
+        videos = stats.attachment_counts["video"]
+        audio = stats.attachment_counts["audio"]
+
+        print(f"\nMessage breakdown:")
+        print(f"  - Text messages:      {text_msgs:,}")
+        print(f"  - Attachments only:   {attachment_msgs:,}")
+        print(f"  - Text + attachment:  {text_with_att:,}")
+        print(f"  - Reactions:          {reactions:,}")
+        print(f"  - Special/app:        {special_msgs:,}")
+        print(f"  - Total:              {stats.total_messages:,}")
+
+        temp_path = self.summary_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write("# iMessage Export Summary\n\n")
+            f.write(f"**Export Date:** {datetime.now().strftime('%Y-%m-%d %H:%M')}\n")
+            f.write(f"**Total Messages:** {stats.total_messages:,}\n")
+            f.write(f"**Total Conversations:** {len(stats.conversations)}\n\n")
+
+            # Date range
+            if stats.first_date:
+                f.write(f"**Date Range:** {stats.first_date} to {stats.last_date}\n\n")
+
+            # Message type breakdown
+            f.write("## Message Types\n\n")
+            f.write(f"- **Text messages:** {text_msgs:,}\n")
+            f.write(f"- **Attachments only:** {attachment_msgs:,}\n")
+            f.write(f"- **Text with attachments:** {text_with_att:,}\n")
+            f.write(f"- **Reactions:** {reactions:,}\n")
+            f.write(f"- **Special/app content:** {special_msgs:,}\n\n")
+
+            # Attachment breakdown
+            f.write("## Attachments\n\n")
+            f.write(f"- **Photos:** {photos:,}\n")
+            f.write(f"- **Videos:** {videos:,}\n")
+            f.write(f"- **Audio messages:** {audio:,}\n\n")
+
+            # Special content breakdown
+            if stats.special_content_counts:
+                f.write("## Special Content (Apps, Games, etc.)\n\n")
+                for content_type, count in sorted(stats.special_content_counts.items(), key=lambda x: -x[1])[:15]:
+                    f.write(f"- **{content_type}:** {count:,}\n")
+                f.write("\n")
+
+            # Top conversations
+            f.write("## Top 20 Conversations (by message count)\n\n")
+            for conv in stats.top_conversations(20):
+                f.write(f"- **{conv['name']}**: {conv['message_count']:,} messages ({conv['type']})\n")
+
+            f.write("\n## Files\n\n")
+            f.write("- `messages.json` - Full structured data for AI analysis\n")
+            f.write("- `messages.csv` - Tabular format for spreadsheets or analysis\n")
+            f.write("- `SUMMARY.md` - This file\n")
+            f.write("- Individual folders - Markdown files organized by contact and date\n")
+        os.replace(temp_path, self.summary_path)
+
+        print(f"Created {self.summary_path}")
+
+
+class ArchiveSink:
+    """Keeps the full history as JSON Lines files under archive/YYYY/MM.jsonl.
+
+    Incremental runs append new messages to their month, so the archive stays
+    complete without re-reading chat.db. A month is only rewritten when a late
+    message lands before its last entry. manifest.json lists every month with
+    its message count and date range.
+    """
 
-    # Create a master index file
-    create_index(OUTPUT_DIR)
+    name = "archive"
+
+    def __init__(self, output_dir, full_export=False):
+        self.archive_dir = os.path.join(output_dir, "archive")
+        self.manifest_path = os.path.join(self.archive_dir, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)["months"]
+        # A full export starts every month from scratch
+        self.previous_months = set(self.manifest) if full_export else set()
+        if full_export:
+            self.manifest = {}
+        self.pending = defaultdict(list)
+        self.touched = set()
+
+    def partition_path(self, month):
+        year, mon = month.split("-")
+        return os.path.join(self.archive_dir, year, f"{mon}.jsonl")
+
+    def write(self, row):
+        self.pending[row.record["timestamp"][:7]].append(row.record)
+
+    def pending_files(self):
+        """Month files the next flush() will append to.
+
+        Months that take a late arrival are rewritten and swapped in whole, so a
+        crash can't leave them half written; they are left out.
+        """
+        return [self.partition_path(month) for month, records in self.pending.items()
+                if not self.is_late(month, records)]
+
+    def is_late(self, month, records):
+        """Whether records start before the month's last entry and have to be merged in."""
+        entry = self.manifest.get(month)
+        return entry is not None and records[0]["timestamp"] < entry["last_message"]
+
+    def flush(self):
+        for month, records in self.pending.items():
+            path = self.partition_path(month)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            lines = [json.dumps(record, separators=(",", ":")) + "\n" for record in records]
+            entry = self.manifest.get(month)
+
+            if entry is None:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                entry = {"messages": 0, "first_message": records[0]["timestamp"], "last_message": records[0]["timestamp"]}
+            elif not self.is_late(month, records):
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+            else:
+                # Late arrival: merge it into the month so lines stay in time order
+                with open(path, 'r', encoding='utf-8') as f:
+                    existing = f.readlines()
+                if len(existing) > entry["messages"]:
+                    # This chunk's merge landed before a crash and is being replayed;
+                    # drop one copy of each of its lines (identical lines are interchangeable)
+                    replayed = Counter(lines)
+                    kept = []
+                    for line in existing:
+                        if replayed[line]:
+                            replayed[line] -= 1
+                        else:
+                            kept.append(line)
+                    existing = kept
+                merged = sorted(existing + lines, key=lambda line: json.loads(line)["timestamp"])
+                temp_path = path + ".tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(merged)
+                os.replace(temp_path, path)
+
+            entry["messages"] += len(records)
+            entry["first_message"] = min(entry["first_message"], records[0]["timestamp"])
+            entry["last_message"] = max(entry["last_message"], records[-1]["timestamp"])
+            self.manifest[month] = entry
+            self.touched.add(month)
+
+        self.pending.clear()
+
+    def checkpoint(self):
+        return {
+            "manifest": copy.deepcopy(self.manifest),
+            "previous_months": sorted(self.previous_months),
+            "touched": sorted(self.touched)
+        }
 
-    # Save state
-    state["last_message_rowid"] = max_rowid
-    state["last_export"] = datetime.now().isoformat()
-    save_state(state)
+    def restore(self, checkpoint):
+        self.manifest = checkpoint["manifest"]
+        self.previous_months = set(checkpoint["previous_months"])
+        self.touched = set(checkpoint["touched"])
 
-    print(f"Exported {messages_written} messages from {len(conversations)} conversations.")
+    def close(self):
+        self.flush()
 
-    conn.close()
-    os.remove(temp_db)
+        # Months that no longer have any messages after a full export
+        for month in self.previous_months - self.touched:
+            path = self.partition_path(month)
+            if os.path.exists(path):
+                os.remove(path)
 
+        if not self.touched and not self.previous_months:
+            return
 
-def export_ai_ready(messages_db_path, full_export=False):
-    """Export messages to AI-ready JSON and CSV formats."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        manifest = {
+            "updated": datetime.now().isoformat(),
+            "total_messages": sum(entry["messages"] for entry in self.manifest.values()),
+            "months": dict(sorted(self.manifest.items()))
+        }
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
 
-    # Create output directory
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+        print(f"Updated {len(self.touched)} month(s) in {self.archive_dir}")
 
-    # Load state
-    state = load_state()
-    last_rowid = 0 if full_export else state.get("last_message_rowid", 0)
 
-    # Copy database to temp location
-    temp_db = os.path.join(os.environ.get("TEMP", "/tmp"), "messages_temp.db")
-    shutil.copy2(messages_db_path, temp_db)
+class DatabaseSink:
+    """Writes every message into desmond.db, a SQLite database with a full-text index.
+
+    Messages are keyed by (source, source_id), so exporting a message again
+    updates its row instead of adding a copy. iMessage rows use the message GUID,
+    since ROWIDs change when the database is rebuilt (a new Mac or phone, or an
+    iCloud re-download).
+    """
+
+    name = "database"
 
-    # Connect to database
-    conn = sqlite3.connect(temp_db)
+    def __init__(self, output_dir, source):
+        self.db_path = os.path.join(output_dir, "desmond.db")
+        self.source = source
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(DB_SCHEMA)
+        try:
+            self.conn.executescript(DB_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # This Python's SQLite was built without FTS5; the indexed columns still work
+            self.has_fts = False
+        self.conversation_ids = {}
+        self.sender_ids = {}
+        self.pending = []
+        self.total_messages = 0
+
+    def conversation_id(self, name, conv_type):
+        if name not in self.conversation_ids:
+            self.conn.execute(
+                "INSERT INTO conversations (source, name, type) VALUES (?, ?, ?) "
+                "ON CONFLICT (source, name) DO UPDATE SET type = excluded.type",
+                (self.source, name, conv_type)
+            )
+            self.conversation_ids[name] = self.conn.execute(
+                "SELECT id FROM conversations WHERE source = ? AND name = ?", (self.source, name)
+            ).fetchone()[0]
+        return self.conversation_ids[name]
+
+    def sender_id(self, name):
+        if name not in self.sender_ids:
+            self.conn.execute("INSERT OR IGNORE INTO senders (name) VALUES (?)", (name,))
+            self.sender_ids[name] = self.conn.execute(
+                "SELECT id FROM senders WHERE name = ?", (name,)
+            ).fetchone()[0]
+        return self.sender_ids[name]
+
+    def add(self, source_id, record):
+        self.pending.append((
+            self.source,
+            source_id,
+            self.conversation_id(record["conversation"], record["conversation_type"]),
+            self.sender_id(record["sender"]),
+            record["timestamp"],
+            int(record["is_from_me"]),
+            record["message_type"],
+            record["text"],
+            ",".join(record["attachment_types"]),
+            record["reaction"],
+            record["special_content"],
+            record["effect"],
+            record.get("source")
+        ))
+
+    def write(self, row):
+        self.add(row.guid, row.record)
+
+    def pending_files(self):
+        # Upserts are safe to repeat, so there is nothing to undo
+        return []
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany(DB_UPSERT_MESSAGE, self.pending)
+        self.total_messages += len(self.pending)
+        self.pending.clear()
+
+    def checkpoint(self):
+        return {"total_messages": self.total_messages}
+
+    def restore(self, checkpoint):
+        self.total_messages = checkpoint["total_messages"]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+        print(f"Updated {self.total_messages} messages in {self.db_path}")
+        if not self.has_fts:
+            print("  (Full-text search is unavailable: this Python's SQLite has no FTS5)")
+
+
+def build_sinks(full_export=False, compact_json=False, archive=False, database=False):
+    """Create the output sinks, named as in export_sink_names()."""
+    # Stats come first so the JSON header and summary see every record
+    stats = ExportStats()
+    sinks = [
+        stats,
+        MarkdownSink(OUTPUT_DIR, full_export=full_export),
+        IndexSink(OUTPUT_DIR),
+        JsonSink(OUTPUT_DIR, stats, compact=compact_json),
+        CsvSink(OUTPUT_DIR),
+        SummarySink(OUTPUT_DIR, stats)
+    ]
+    if archive:
+        sinks.append(ArchiveSink(OUTPUT_DIR, full_export=full_export))
+    if database:
+        sinks.append(DatabaseSink(OUTPUT_DIR, "iphone_backup"))
+    return sinks
+
+
+def sql_ids(ids):
+    """Format ROWIDs for an IN (...) list; they're integers from the database, so they're safe to inline."""
+    return ",".join(str(int(rowid)) for rowid in ids)
+
+
+def matching_handles(name):
+    """ROWIDs of the handles whose contact name, phone number or email is name (any case)."""
+    name = name.lower()
+    return [rowid for rowid, (identifier, contact) in HANDLES_CACHE.items()
+            if contact.lower() == name or (identifier or "").lower() == name]
+
+
+def message_filter_sql(filters):
+    """Turn the --since/--until/--conversation/--sender filters into conditions on the message query.
+
+    Conversation and sender names are matched against the resolved chat and handle
+    caches, so SQLite only has to look up those chats' and handles' messages instead
+    of every row being decoded and thrown away. Returns (where, params).
+    """
+    clauses = []
+    params = []
+    if "since" in filters:
+        clauses.append("message.date >= ?")
+        params.append(to_apple_time(filters["since"]))
+    if "until" in filters:
+        # The --until day is included
+        clauses.append("message.date < ?")
+        params.append(to_apple_time(filters["until"] + timedelta(days=1)))
+    if "conversation" in filters:
+        name = filters["conversation"].lower()
+        chat_ids = [rowid for rowid, chat in CHATS_CACHE.items() if chat and chat[0].lower() == name]
+        # Messages outside a named chat are filed under their sender
+        unnamed_chat_ids = [rowid for rowid, chat in CHATS_CACHE.items() if chat is None]
+        handle_ids = matching_handles(name)
+        clauses.append(
+            f"(chat_message_join.chat_id IN ({sql_ids(chat_ids)}) OR "
+            f"((chat_message_join.chat_id IS NULL OR chat_message_join.chat_id IN ({sql_ids(unnamed_chat_ids)})) "
+            f"AND message.handle_id IN ({sql_ids(handle_ids)})))"
+        )
+    if "sender" in filters:
+        if filters["sender"].lower() == "me":
+            clauses.append("message.is_from_me = 1")
+        else:
+            clauses.append(f"message.is_from_me = 0 AND message.handle_id IN ({sql_ids(matching_handles(filters['sender']))})")
+    return " AND ".join(clauses), params
+
+
+def iter_message_chunks(conn, lower, upper, position=None, batch_size=BATCH_SIZE, where="", params=()):
+    """Yield the messages with lower < ROWID <= upper in (date, ROWID) order, batch_size rows at a time.
+
+    Each chunk is its own query that starts after the (date, ROWID) of the previous
+    chunk's last row, so SQLite seeks straight there in the date index instead of
+    sorting everything that's left, and no read is held open between chunks. Pass
+    position to start after a given [date, ROWID], and where/params to add conditions.
+    """
     cursor = conn.cursor()
 
-    # Get messages with more metadata including attachment, reaction, and special message info
+    # Get messages with attachment, reaction, and special message info
     query = """
     SELECT
         message.ROWID,
@@ -477,378 +1743,253 @@ def export_ai_ready(messages_db_path, full_export=False):
         message.is_from_me,
         message.handle_id,
         message.associated_message_type,
-        message.associated_message_guid,
         message.balloon_bundle_id,
         message.expressive_send_style_id,
-        chat.chat_identifier,
-        chat.display_name,
-        chat.ROWID as chat_rowid
+        chat_message_join.chat_id,
+        message.guid
     FROM message
     LEFT JOIN chat_message_join ON message.ROWID = chat_message_join.message_id
-    LEFT JOIN chat ON chat_message_join.chat_id = chat.ROWID
-    WHERE message.ROWID > ?
-    ORDER BY message.date ASC
+    WHERE message.ROWID > ? AND message.ROWID <= ?
     """
+    if where:
+        query += f" AND {where}"
 
-    cursor.execute(query, (last_rowid,))
-    messages = cursor.fetchall()
-
-    if not messages:
-        print("No new messages to export.")
-        conn.close()
-        os.remove(temp_db)
-        return
-
-    # Get all attachments
-    cursor.execute("""
-        SELECT
-            message_attachment_join.message_id,
-            attachment.filename,
-            attachment.mime_type,
-            attachment.transfer_name
-        FROM attachment
-        JOIN message_attachment_join ON attachment.ROWID = message_attachment_join.attachment_id
-    """)
-
-    attachments_by_msg = defaultdict(list)
-    for row in cursor.fetchall():
-        msg_id, filename, mime_type, transfer_name = row
-        att_info = {
-            "filename": transfer_name or (filename.split('/')[-1] if filename else None),
-            "type": mime_type
-        }
-        # Categorize attachment
-        if mime_type:
-            if mime_type.startswith('image'):
-                att_info["category"] = "photo"
-            elif mime_type.startswith('video'):
-                att_info["category"] = "video"
-            elif mime_type.startswith('audio'):
-                att_info["category"] = "audio"
-            else:
-                att_info["category"] = "file"
+    while True:
+        if position is None:
+            page = cursor.execute(query + " ORDER BY message.date ASC, message.ROWID ASC LIMIT ?",
+                                  [lower, upper, *params, batch_size])
         else:
-            att_info["category"] = "file"
-
-        attachments_by_msg[msg_id].append(att_info)
-
-    # Reaction type mapping
-    reaction_types = {
-        2000: "loved",
-        2001: "liked",
-        2002: "disliked",
-        2003: "laughed",
-        2004: "emphasized",
-        2005: "questioned",
-        3000: "removed love",
-        3001: "removed like",
-        3002: "removed dislike",
-        3003: "removed laugh",
-        3004: "removed emphasis",
-        3005: "removed question"
-    }
+            page = cursor.execute(query + " AND (message.date, message.ROWID) > (?, ?)"
+                                  " ORDER BY message.date ASC, message.ROWID ASC LIMIT ?",
+                                  [lower, upper, *params, *position, batch_size])
+        rows = page.fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        position = [rows[-1][2], rows[-1][0]]
+
+
+def export_filtered_rows(conn, filters, batch_size=BATCH_SIZE, compact_json=False):
+    """Export only the messages matching --since/--until/--conversation/--sender.
+
+    The filters are part of the message query, so only matching rows are read. A
+    targeted export writes messages.json, messages.csv and SUMMARY.md for its slice
+    to the filtered folder, and leaves the full export's files, markdown folders,
+    archive, database and watermarks, which track the whole history, alone. Returns
+    the number of messages exported.
+    """
+    where, params = message_filter_sql(filters)
+    upper = conn.execute("SELECT MAX(ROWID) FROM message").fetchone()[0] or 0
+
+    output_dir = os.path.join(OUTPUT_DIR, "filtered")
+    os.makedirs(output_dir, exist_ok=True)
+    stats = ExportStats()
+    sinks = [stats, JsonSink(output_dir, stats, compact=compact_json), CsvSink(output_dir), SummarySink(output_dir, stats)]
+
+    lookup_cursor = conn.cursor()
+    for rows in iter_message_chunks(conn, 0, upper, batch_size=batch_size, where=where, params=params):
+        attachments_by_msg = load_attachments(lookup_cursor, [row[0] for row in rows])
+        for row in rows:
+            export_row = decode_message(row, attachments_by_msg, lookup_cursor)
+            if export_row is None:
+                continue
+            for sink in sinks:
+                sink.write(export_row)
+
+        for sink in sinks:
+            sink.flush()
+
+    if stats.total_messages:
+        for sink in sinks:
+            sink.close()
+    return stats.total_messages
+
+
+def export_new_rows(conn, state, full_export=False, batch_size=BATCH_SIZE, compact_json=False, archive=False, database=False):
+    """Stream the messages each sink hasn't committed yet from an open Messages database connection.
+
+    Every sink has its own watermark in state["sinks"] (the last ROWID it has
+    written out) and only gets rows past it. Rows up to the MAX(ROWID) seen at the
+    start are read in (date, ROWID) order and handed out in chunks of batch_size.
+    After each chunk the sinks are flushed and state["checkpoint"] records the read
+    position and each sink's progress, so an interrupted export carries on after the
+    last committed chunk instead of starting over. Updates state in place and returns
+    the highest ROWID covered, or None if there was nothing new.
+    """
+    checkpoint = state.get("checkpoint")
+    if checkpoint:
+        # Roll back appends from a flush that didn't finish
+        for path, size in checkpoint["undo"].items():
+            truncate_file(path, size)
+        checkpoint["undo"] = {}
+        if full_export and not checkpoint["options"]["full_export"]:
+            # A fresh full export replaces the interrupted incremental one
+            checkpoint = None
+
+    if checkpoint:
+        print(f"Resuming the interrupted export ({len(checkpoint['closed'])} of {len(checkpoint['watermarks'])} outputs finished)...")
+    else:
+        options = {"full_export": full_export, "compact_json": compact_json, "archive": archive, "database": database}
+        upper = conn.execute("SELECT MAX(ROWID) FROM message").fetchone()[0] or 0
+        checkpoint = {
+            "options": options,
+            "watermarks": sink_watermarks(state, export_sink_names(archive, database), full_export),
+            "upper": upper,
+            "position": None,
+            "sinks": None,
+            "closed": [],
+            "undo": {}
+        }
+    watermarks = checkpoint["watermarks"]
+    upper = checkpoint["upper"]
+    lower = min(watermarks.values())
 
-    # Special message type mapping (balloon_bundle_id)
-    special_types = {
-        "com.apple.Handwriting.HandwritingProvider": "handwritten message",
-        "com.apple.DigitalTouchBalloonProvider": "Digital Touch",
-        "com.apple.messages.MSMessageExtensionBalloonPlugin:0000000000:com.apple.icloud.apps.messages.business.extension": "business chat",
-        "com.apple.messages.URLBalloonProvider": "link preview",
-        "com.apple.Stickers.UserGenerated.MessagesExtension": "sticker",
-        "com.apple.messages.MSMessageExtensionBalloonPlugin": "app message",
-    }
+    if upper <= lower:
+        state.pop("checkpoint", None)
+        return None
 
-    # Expressive send styles
-    expressive_styles = {
-        "com.apple.MobileSMS.expressivesend.gentle": "sent gently",
-        "com.apple.MobileSMS.expressivesend.impact": "sent with slam",
-        "com.apple.MobileSMS.expressivesend.loud": "sent loud",
-        "com.apple.MobileSMS.expressivesend.invisibleink": "sent with invisible ink",
-        "com.apple.messages.effect.CKEchoEffect": "sent with echo",
-        "com.apple.messages.effect.CKSpotlightEffect": "sent with spotlight",
-        "com.apple.messages.effect.CKHappyBirthdayEffect": "sent with balloons",
-        "com.apple.messages.effect.CKHeartEffect": "sent with heart",
-        "com.apple.messages.effect.CKLasersEffect": "sent with lasers",
-        "com.apple.messages.effect.CKFireworksEffect": "sent with fireworks",
-        "com.apple.messages.effect.CKShootingStarEffect": "sent with shooting star",
-        "com.apple.messages.effect.CKSparklesEffect": "sent with celebration",
-        "com.apple.messages.effect.CKConfettiEffect": "sent with confetti",
-    }
+    chunks = iter_message_chunks(conn, lower, upper, position=checkpoint["position"], batch_size=batch_size)
+    rows = next(chunks, None)
 
-    # Build structured data
-    all_messages = []
-    conversations_meta = {}
-    skipped_special = 0
+    if rows is None and checkpoint["sinks"] is None:
+        state.pop("checkpoint", None)
+        return None
 
-    for row in messages:
-        rowid, text, date, is_from_me, handle_id, assoc_msg_type, assoc_msg_guid, balloon_bundle_id, expressive_style, chat_id, display_name, chat_rowid = row
+    sinks = build_sinks(**checkpoint["options"])
+    if checkpoint["sinks"] is not None:
+        for sink in sinks:
+            sink.restore(checkpoint["sinks"][sink.name])
+    open_sinks = [sink for sink in sinks if sink.name not in checkpoint["closed"]]
+    state["checkpoint"] = checkpoint
+
+    # Decode each row once and hand it to every sink that hasn't seen it, one chunk at a time
+    lookup_cursor = conn.cursor()
+    while rows:
+        # Only fetch attachments for the messages in this chunk
+        attachments_by_msg = load_attachments(lookup_cursor, [row[0] for row in rows])
+        for row in rows:
+            export_row = decode_message(row, attachments_by_msg, lookup_cursor)
+            if export_row is None:
+                continue
+            for sink in open_sinks:
+                if row[0] > watermarks[sink.name]:
+                    sink.write(export_row)
+
+        # Note the current size of every file the flush appends to, so a crash can be undone
+        checkpoint["undo"] = {path: file_size(path) for sink in open_sinks for path in sink.pending_files()}
+        if checkpoint["undo"]:
+            save_state(state)
+
+        for sink in open_sinks:
+            sink.flush()
+
+        checkpoint["position"] = [rows[-1][2], rows[-1][0]]
+        checkpoint["sinks"] = {sink.name: sink.checkpoint() for sink in sinks}
+        checkpoint["undo"] = {}
+        save_state(state)
+
+        rows = next(chunks, None)
+
+    for sink in open_sinks:
+        sink.close()
+        checkpoint["closed"].append(sink.name)
+        save_state(state)
+
+    lookups = lookup_contact_name.cache_info()
+    print(f"Contact lookups: {lookups.currsize:,} distinct identifiers ({lookups.hits:,} cache hits, {lookups.misses:,} misses)")
+
+    # Commit: every sink has now written out everything up to upper
+    committed = state.setdefault("sinks", {})
+    for name, watermark in watermarks.items():
+        committed[name] = max(watermark, upper)
+    state["last_message_rowid"] = min(committed.values())
+    del state["checkpoint"]
+
+    return upper
+
+
+def export_messages(backup_dir, full_export=False, batch_size=BATCH_SIZE, compact_json=False, archive=False, database=False, filters=None):
+    """Export new messages in a single pass, feeding every output sink.
+
+    With filters (see message_filter_sql()) only the matching messages are exported,
+    whether or not they were exported before. Returns True if anything was exported.
+    """
+    messages_db_path = os.path.join(backup_dir, MESSAGES_DB_HASH)
 
-        # Get timestamp
-        msg_datetime = convert_apple_time(date)
-        if msg_datetime is None:
-            continue
+    # Load state
+    state = load_state()
+    if filters and "checkpoint" in state:
+        print("An interrupted export needs to finish first. Run again without --since/--until/--conversation/--sender.")
+        return False
+    watermarks = sink_watermarks(state, export_sink_names(archive, database), full_export)
+
+    # Preflight: stop before any heavy work if the backup has nothing new for any sink
+    started = time.perf_counter()
+    has_new, fingerprint = check_for_new_messages(messages_db_path, state, immutable=True)
+    caught_up = "checkpoint" not in state and min(watermarks.values()) >= state.get("last_message_rowid", 0)
+    if not full_export and not filters and caught_up and not has_new:
+        print(f"No new messages to export (checked in {(time.perf_counter() - started) * 1000:.1f} ms).")
+        if state.get("source_fingerprint") != fingerprint:
+            state["source_fingerprint"] = fingerprint
+            save_state(state)
+        return False
+
+    # Load contacts for name lookup
+    load_contacts(backup_dir)
 
-        # Get conversation name
-        if display_name:
-            conv_name = display_name
-            conv_type = "group"
-        elif chat_id:
-            conv_name = lookup_contact_name(chat_id)
-            if conv_name == chat_id or conv_name.startswith("chat"):
-                participants = get_chat_participants(chat_id, cursor)
-                if participants:
-                    conv_name = participants
-                    conv_type = "group"
-                else:
-                    conv_name = chat_id
-                    conv_type = "unknown"
-            else:
-                conv_type = "direct"
-        else:
-            conv_name = get_contact_name(handle_id, cursor) if handle_id else "Unknown"
-            conv_type = "direct"
+    # Create output directory
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-        # Get sender name
-        if is_from_me:
-            sender = "Me"
-        else:
-            sender = get_contact_name(handle_id, cursor) if handle_id else conv_name
-
-        # Determine message type and content
-        msg_type = "text"
-        content = text
-        attachments = attachments_by_msg.get(rowid, [])
-        reaction = None
-        special_content = None
-        effect = None
-
-        # Check for expressive send style
-        if expressive_style and expressive_style in expressive_styles:
-            effect = expressive_styles[expressive_style]
-
-        # Check for reaction
-        if assoc_msg_type and assoc_msg_type in reaction_types:
-            msg_type = "reaction"
-            reaction = reaction_types[assoc_msg_type]
-            content = f"{reaction}" if not text else text
-        # Check for attachment
-        elif attachments:
-            if text:
-                msg_type = "text_with_attachment"
-            else:
-                msg_type = "attachment"
-                # Describe the attachment
-                att_descriptions = []
-                for att in attachments:
-                    att_descriptions.append(f"[{att['category']}]")
-                content = " ".join(att_descriptions)
-        # Check for special message types
-        elif not text and balloon_bundle_id:
-            msg_type = "special"
-            # Try to identify the specific type
-            for bundle_key, bundle_name in special_types.items():
-                if bundle_key in balloon_bundle_id:
-                    special_content = bundle_name
-                    break
-            if not special_content:
-                if "gamepigeon" in balloon_bundle_id.lower():
-                    special_content = "GamePigeon game"
-                elif "pay" in balloon_bundle_id.lower() or "wallet" in balloon_bundle_id.lower():
-                    special_content = "Apple Pay"
-                elif "fitness" in balloon_bundle_id.lower():
-                    special_content = "Fitness sharing"
-                elif "music" in balloon_bundle_id.lower():
-                    special_content = "Apple Music"
-                elif "photo" in balloon_bundle_id.lower():
-                    special_content = "shared photo"
-                else:
-                    special_content = f"app content ({balloon_bundle_id.split('.')[-1] if '.' in balloon_bundle_id else 'unknown'})"
-            content = f"[{special_content}]"
-        elif not text:
-            # No text, no attachment, no balloon - likely system message or empty
-            msg_type = "special"
-            content = "[unknown message type]"
-            skipped_special += 1
-
-        # Build message record
-        msg_record = {
-            "timestamp": msg_datetime.isoformat(),
-            "date": msg_datetime.strftime("%Y-%m-%d"),
-            "time": msg_datetime.strftime("%H:%M:%S"),
-            "year": msg_datetime.year,
-            "month": msg_datetime.month,
-            "day": msg_datetime.day,
-            "hour": msg_datetime.hour,
-            "day_of_week": msg_datetime.strftime("%A"),
-            "conversation": conv_name,
-            "conversation_type": conv_type,
-            "sender": sender,
-            "is_from_me": bool(is_from_me),
-            "message_type": msg_type,
-            "text": content,
-            "has_attachment": len(attachments) > 0,
-            "attachment_types": [a["category"] for a in attachments] if attachments else [],
-            "reaction": reaction,
-            "special_content": special_content,
-            "effect": effect,
-            "char_count": len(content) if content else 0,
-            "word_count": len(content.split()) if content else 0
-        }
+    # Open the backup's database read-only in place instead of copying it
+    conn, snapshot_path = open_source_db(messages_db_path, immutable=True)
+    cursor = conn.cursor()
+    load_handles(cursor)
+    load_chats(cursor)
 
-        all_messages.append(msg_record)
+    if filters:
+        exported = export_filtered_rows(conn, filters, batch_size=batch_size, compact_json=compact_json)
+        close_source_db(conn, snapshot_path)
+        if not exported:
+            print("No messages match the filters.")
+        return bool(exported)
 
-        # Track conversation metadata
-        if conv_name not in conversations_meta:
-            conversations_meta[conv_name] = {
-                "name": conv_name,
-                "type": conv_type,
-                "message_count": 0,
-                "first_message": msg_datetime.isoformat(),
-                "last_message": msg_datetime.isoformat()
-            }
-        conversations_meta[conv_name]["message_count"] += 1
-        conversations_meta[conv_name]["last_message"] = msg_datetime.isoformat()
+    max_rowid = export_new_rows(conn, state, full_export=full_export, batch_size=batch_size,
+                                compact_json=compact_json, archive=archive, database=database)
+    close_source_db(conn, snapshot_path)
 
-    conn.close()
-    os.remove(temp_db)
-
-    # Calculate message type counts for terminal output
-    text_count = sum(1 for m in all_messages if m["message_type"] == "text")
-    attachment_count = sum(1 for m in all_messages if m["message_type"] == "attachment")
-    text_att_count = sum(1 for m in all_messages if m["message_type"] == "text_with_attachment")
-    reaction_count = sum(1 for m in all_messages if m["message_type"] == "reaction")
-    special_count = sum(1 for m in all_messages if m["message_type"] == "special")
-
-    print(f"\nMessage breakdown:")
-    print(f"  - Text messages:      {text_count:,}")
-    print(f"  - Attachments only:   {attachment_count:,}")
-    print(f"  - Text + attachment:  {text_att_count:,}")
-    print(f"  - Reactions:          {reaction_count:,}")
-    print(f"  - Special/app:        {special_count:,}")
-    print(f"  - Total:              {len(all_messages):,}")
-
-    # Write JSON
-    json_path = os.path.join(OUTPUT_DIR, "messages.json")
-    export_data = {
-        "export_date": datetime.now().isoformat(),
-        "total_messages": len(all_messages),
-        "total_conversations": len(conversations_meta),
-        "conversations": list(conversations_meta.values()),
-        "messages": all_messages
-    }
+    if max_rowid is None:
+        print("No new messages to export.")
+    else:
+        state["last_export"] = datetime.now().isoformat()
 
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(export_data, f, indent=2)
-
-    print(f"\nCreated {json_path}")
-
-    # Write CSV
-    csv_path = os.path.join(OUTPUT_DIR, "messages.csv")
-
-    if all_messages:
-        fieldnames = ["timestamp", "date", "time", "year", "month", "day", "hour",
-                      "day_of_week", "conversation", "conversation_type", "sender",
-                      "is_from_me", "message_type", "text", "has_attachment",
-                      "attachment_types", "reaction", "special_content", "effect",
-                      "char_count", "word_count"]
-
-        import csv
-        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            # Convert attachment_types list to string for CSV
-            for msg in all_messages:
-                msg_copy = msg.copy()
-                msg_copy["attachment_types"] = ",".join(msg_copy["attachment_types"]) if msg_copy["attachment_types"] else ""
-                writer.writerow(msg_copy)
-
-        print(f"Created {csv_path}")
-
-    # Write a summary file for quick context
-    summary_path = os.path.join(OUTPUT_DIR, "SUMMARY.md")
-
-    # Calculate stats
-    text_msgs = sum(1 for m in all_messages if m["message_type"] == "text")
-    attachment_msgs = sum(1 for m in all_messages if m["message_type"] == "attachment")
-    text_with_att = sum(1 for m in all_messages if m["message_type"] == "text_with_attachment")
-    reactions = sum(1 for m in all_messages if m["message_type"] == "reaction")
-    special_msgs = sum(1 for m in all_messages if m["message_type"] == "special")
-
-    photos = sum(1 for m in all_messages if "photo" in m.get("attachment_types", []))
-    videos = sum(1 for m in all_messages if "video" in m.get("attachment_types", []))
-    audio = sum(1 for m in all_messages if "audio" in m.get("attachment_types", []))
-
-    # Count special content types
-    special_content_counts = defaultdict(int)
-    for m in all_messages:
-        if m.get("special_content"):
-            special_content_counts[m["special_content"]] += 1
-
-    with open(summary_path, 'w', encoding='utf-8') as f:
-        f.write("# iMessage Export Summary\n\n")
-        f.write(f"**Export Date:** {datetime.now().strftime('%Y-%m-%d %H:%M')}\n")
-        f.write(f"**Total Messages:** {len(all_messages):,}\n")
-        f.write(f"**Total Conversations:** {len(conversations_meta)}\n\n")
-
-        # Date range
-        if all_messages:
-            first_date = all_messages[0]["date"]
-            last_date = all_messages[-1]["date"]
-            f.write(f"**Date Range:** {first_date} to {last_date}\n\n")
-
-        # Message type breakdown
-        f.write("## Message Types\n\n")
-        f.write(f"- **Text messages:** {text_msgs:,}\n")
-        f.write(f"- **Attachments only:** {attachment_msgs:,}\n")
-        f.write(f"- **Text with attachments:** {text_with_att:,}\n")
-        f.write(f"- **Reactions:** {reactions:,}\n")
-        f.write(f"- **Special/app content:** {special_msgs:,}\n\n")
-
-        # Attachment breakdown
-        f.write("## Attachments\n\n")
-        f.write(f"- **Photos:** {photos:,}\n")
-        f.write(f"- **Videos:** {videos:,}\n")
-        f.write(f"- **Audio messages:** {audio:,}\n\n")
-
-        # Special content breakdown
-        if special_content_counts:
-            f.write("## Special Content (Apps, Games, etc.)\n\n")
-            for content_type, count in sorted(special_content_counts.items(), key=lambda x: -x[1])[:15]:
-                f.write(f"- **{content_type}:** {count:,}\n")
-            f.write("\n")
-
-        # Top conversations
-        f.write("## Top 20 Conversations (by message count)\n\n")
-        sorted_convos = sorted(conversations_meta.values(), key=lambda x: x["message_count"], reverse=True)[:20]
-        for conv in sorted_convos:
-            f.write(f"- **{conv['name']}**: {conv['message_count']:,} messages ({conv['type']})\n")
-
-        f.write("\n## Files\n\n")
-        f.write("- `messages.json` - Full structured data for AI analysis\n")
-        f.write("- `messages.csv` - Tabular format for spreadsheets or analysis\n")
-        f.write("- `SUMMARY.md` - This file\n")
-        f.write("- Individual folders - Markdown files organized by contact and date\n")
-
-    print(f"Created {summary_path}")
+    # Save state
+    state["source_fingerprint"] = fingerprint
+    save_state(state)
+    return max_rowid is not None
 
 
 def create_index(output_dir):
-    """Create an index file listing all conversations and recent activity."""
+    """Create an index file listing all conversations, from the totals MarkdownSink keeps."""
     index_path = os.path.join(output_dir, "INDEX.md")
+    temp_path = index_path + ".tmp"
 
-    with open(index_path, 'w', encoding='utf-8') as f:
+    conversations = {}
+    conversations_path = os.path.join(output_dir, ".conversations.json")
+    if os.path.exists(conversations_path):
+        with open(conversations_path, 'r', encoding='utf-8') as f:
+            conversations = json.load(f)
+
+    with open(temp_path, 'w', encoding='utf-8') as f:
         f.write("# iMessage Export Index\n\n")
         f.write(f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n")
         f.write("## Conversations\n\n")
 
-        for item in sorted(os.listdir(output_dir)):
-            item_path = os.path.join(output_dir, item)
-            if os.path.isdir(item_path) and not item.startswith('.'):
-                # Count messages and get date range
-                md_files = [f for f in os.listdir(item_path) if f.endswith('.md')]
-                if md_files:
-                    dates = sorted([f.replace('.md', '') for f in md_files])
-                    f.write(f"- **{item}**: {len(md_files)} days of messages ({dates[0]} to {dates[-1]})\n")
+        for conv_name, stats in sorted(conversations.items()):
+            f.write(f"- **{conv_name}**: {stats['days']} days of messages, {stats['messages']:,} messages "
+                    f"({stats['first_date']} to {stats['last_date']})\n")
+    os.replace(temp_path, index_path)
 
 
 def main():
@@ -860,12 +2001,37 @@ def main():
     print()
 
     full_export = "--full" in sys.argv
+    compact_json = "--compact-json" in sys.argv
+    # Once an archive exists, every run keeps it up to date
+    archive_dir = os.path.join(OUTPUT_DIR, "archive")
+    archive = "--archive" in sys.argv or os.path.isdir(archive_dir)
+    database = "--db" in sys.argv or os.path.exists(os.path.join(OUTPUT_DIR, "desmond.db"))
     custom_backup = None
+    batch_size = BATCH_SIZE
+    filters = {}
 
-    # Check for custom backup path
+    # Check for custom backup path, batch size and filters
     for i, arg in enumerate(sys.argv):
-        if arg == "--backup" and i + 1 < len(sys.argv):
+        if i + 1 >= len(sys.argv):
+            break
+        if arg == "--backup":
             custom_backup = sys.argv[i + 1]
+        elif arg == "--batch-size":
+            try:
+                batch_size = int(sys.argv[i + 1])
+            except ValueError:
+                batch_size = 0
+            if batch_size < 1:
+                print("Error: --batch-size needs a number of messages, 1 or more (e.g. --batch-size 1000)")
+                sys.exit(1)
+        elif arg in ("--since", "--until"):
+            try:
+                filters[arg[2:]] = datetime.strptime(sys.argv[i + 1], "%Y-%m-%d")
+            except ValueError:
+                print(f"Error: {arg} needs a date like 2024-01-31")
+                sys.exit(1)
+        elif arg in ("--conversation", "--sender"):
+            filters[arg[2:]] = sys.argv[i + 1]
 
     # Find backup directory
     if custom_backup:
@@ -904,24 +2070,20 @@ def main():
         print("4. Create a new backup")
         sys.exit(1)
 
-    # Load contacts
-    load_contacts(backup_dir)
-
-    if full_export:
+    if filters:
+        print("\nExporting only the messages that match the filters...")
+    elif full_export:
         print("\nRunning full export of all messages...")
     else:
         print("\nExporting new messages since last run...")
+        if archive and not os.path.isdir(archive_dir):
+            print("Starting a new archive, which will include your whole history.")
 
     try:
-        # Export markdown files (for human browsing)
-        export_messages(messages_db, full_export=full_export)
-
-        # Export AI-ready JSON and CSV
-        print("\nCreating AI-ready exports...")
-        export_ai_ready(messages_db, full_export=full_export)
-
-        print(f"\nExport complete! Files saved to:")
-        print(f"  {OUTPUT_DIR}")
+        # Export markdown (for human browsing) plus AI-ready JSON and CSV in one pass
+        if export_messages(backup_dir, full_export=full_export, batch_size=batch_size, compact_json=compact_json, archive=archive, database=database, filters=filters):
+            print(f"\nExport complete! Files saved to:")
+            print(f"  {os.path.join(OUTPUT_DIR, 'filtered') if filters else OUTPUT_DIR}")
 
     except Exception as e:
         print(f"\nError: {e}")